@@ -12,9 +12,49 @@ from pathlib import Path
 from cmap import Colormap
 from multiview_stitcher import vis_utils
 import multiprocessing as mp
+from functools import lru_cache
 
 mp.set_start_method('spawn', force=True)
 
+# one colormap per channel, in channel order
+COLORMAP_NAMES = (
+    "cmap:white",
+    "cmap:magenta",
+    "cmap:cyan",
+    "cmap:red",
+    "cmap:yellow",
+    "cmasher:cosmic",
+    "cmasher:dusk",
+    "cmasher:eclipse",
+    "cmasher:emerald",
+    "chrisluts:BOP_Orange",
+    "cmasher:sapphire",
+    "chrisluts:BOP_Blue",
+    "cmap:magenta",
+    "cmap:cyan",
+    "cmap:red",
+    "cmap:yellow",
+    "cmasher:cosmic",
+)
+
+
+@lru_cache(maxsize=None)
+def napari_colormap(name: str):
+    """Build a napari colormap once per name.
+
+    Parameters
+    ----------
+    name: str
+        cmap colormap name
+
+    Returns
+    -------
+    colormap: napari.utils.Colormap
+        napari colormap
+    """
+
+    return Colormap(name).to_napari()
+
 
 def view_fused(root_path: Path):
     """Load and view all individual channels using neuroglancer.
@@ -25,27 +65,6 @@ def view_fused(root_path: Path):
         path to experiment
     """
     
-    # generate 17 colormaps
-    colormaps = [
-        Colormap("cmap:white").to_napari(),
-        Colormap("cmap:magenta").to_napari(),
-        Colormap("cmap:cyan").to_napari(),
-        Colormap("cmap:red").to_napari(),
-        Colormap("cmap:yellow").to_napari(),
-        Colormap("cmasher:cosmic").to_napari(),
-        Colormap("cmasher:dusk").to_napari(),
-        Colormap("cmasher:eclipse").to_napari(),
-        Colormap("cmasher:emerald").to_napari(),
-        Colormap("chrisluts:BOP_Orange").to_napari(),
-        Colormap("cmasher:sapphire").to_napari(),
-        Colormap("chrisluts:BOP_Blue").to_napari(),
-        Colormap("cmap:magenta").to_napari(),
-        Colormap("cmap:cyan").to_napari(),
-        Colormap("cmap:red").to_napari(),
-        Colormap("cmap:yellow").to_napari(),
-        Colormap("cmasher:cosmic").to_napari(),
-    ]
-    
     # find all ome-zarr paths
     ome_path = root_path / Path("fused")
     omezarr_paths = sorted(ome_path.glob("*.ome.zarr"))
@@ -62,7 +81,7 @@ def view_fused(root_path: Path):
             str(omezarr_path),
             plugin="napari-ome-zarr",
             blending="additive",
-            colormap = colormaps[ch_idx],
+            colormap = napari_colormap(COLORMAP_NAMES[ch_idx]),
             contrast_limits=contrast_limits
         )
     napari.run()
@@ -16,6 +16,7 @@ from merfish3danalysis.utils.dataio import read_metadatafile, write_metadata
 from typing import Optional
 import numpy as np
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 def convert_simulation(
     root_path: Path,
@@ -71,7 +72,8 @@ def convert_simulation(
     simulated_acq_path.mkdir(exist_ok=True)
     
     # execute fake experiment. Don't write all metadata to images, just what we need.
-    for r_idx in range(num_rounds):
+    # rounds are independent files, so write them from a thread pool.
+    def write_round(r_idx: int):
         tile_path = simulated_acq_path / Path("data_r"+str(r_idx+1).zfill(4)+"_tile"+str(fake_tile_id).zfill(4)+"_1")
         tile_path.mkdir(exist_ok=True)
         image_path = tile_path / Path("data_r"+str(r_idx+1).zfill(4)+"_tile"+str(fake_tile_id).zfill(4)+".tif")
@@ -89,6 +91,9 @@ def convert_simulation(
                                 'yellow_active': True,
                                 'red_active': True}]
         write_metadata(current_stage_data[0], stage_metadata_path)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write_round, range(num_rounds)))
         
     scan_param_data = [{'root_name': str(root_name),
                         'scan_type': "synthetic",
@@ -18,6 +18,7 @@ History:
 """
 
 import numpy as np
+from numpy.typing import ArrayLike
 from typing import Union, Optional
 import gc
 import SimpleITK as sitk
@@ -26,15 +27,23 @@ from merfish3danalysis.utils.registration import (
     compute_optical_flow,
     apply_transform,
     compute_rigid_transform,
+    translate_image,
+    warp_with_optical_flow,
+    CUCIM_AVAILABLE,
 )
 from merfish3danalysis.utils.imageprocessing import (
     chunked_cudadecon,
-    downsample_image_isotropic
+    downsample_image_isotropic,
+    sum_pixels_in_roi,
 )
 from ufish.api import UFish
 import torch
 import cupy as cp
-import builtins
+import io
+from contextlib import redirect_stdout
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 class DataRegistration:
@@ -79,7 +88,6 @@ class DataRegistration:
         self.save_all_polyDT_registered = save_all_polyDT_registered
         self._decon_iters = decon_iters
         self._decon_background = decon_background
-        self._original_print = builtins.print
 
     # -----------------------------------
     # property access for class variables
@@ -224,29 +232,28 @@ class DataRegistration:
         self._apply_registration_to_bits()
 
     def _load_raw_data(self):
-        """Load raw data across rounds for one tile."""
+        """Prepare raw data across rounds for one tile.
 
-        self._data_raw = []
-        stage_positions = []
+        Reads are started on demand by _request_raw_data, so only the rounds
+        being registered are held in memory.
+        """
+
+        self._data_raw = [None] * len(self._round_ids)
 
-        for round_id in self._round_ids:
-            self._data_raw.append(
-                self._datastore.load_local_corrected_image(
+    def _request_raw_data(self, r_idx: int):
+        """Start reading raw data for one round, if not already started.
+        
+        Parameters
+        ----------
+        r_idx : int
+            Round index.
+        """
+
+        if r_idx < len(self._data_raw) and self._data_raw[r_idx] is None:
+            self._data_raw[r_idx] = self._datastore.load_local_corrected_image(
                 tile=self._tile_id,
-                round=round_id,
-                )
+                round=self._round_ids[r_idx],
             )
-            
-            stage_position, _ = self._datastore.load_local_stage_position_zyx_um(
-                    tile=self._tile_id,
-                    round=round_id
-                )
-            
-            stage_positions.append(stage_position)
-
-        self._stage_positions = np.stack(stage_positions, axis=0)
-        del stage_positions
-        gc.collect()
 
     def _generate_registrations(self):
         """Generate registered, deconvolved fiducial data and save to datastore."""
@@ -261,46 +268,62 @@ class DataRegistration:
         else:
             has_reg_decon_data = True
             
+        # the reference round and its downsampled copies are the same for
+        # every round, so compute them once per tile. The copies used for
+        # rigid registration stay on the GPU, so the reference is uploaded
+        # and projected there instead of once per round on the host
+        ref_image_decon = None
+        ref_image_decon_ds = {}
+
+        # write each registered round in the background while the next
+        # round is deconvolved and registered, keeping one write in flight
+        write_future = None
+
+        # every polyDT round is deconvolved with the first round's emission
+        # wavelength, so read it once per tile
+        polyDT_em_wavelength_um = float(
+            self._datastore.load_local_wavelengths_um(
+                tile=self._tile_id,
+                round=self._round_ids[0]
+            )[1]
+        )
+
         if not (has_reg_decon_data) or self._overwrite_registered:
 
+            self._request_raw_data(0)
             ref_image_decon = chunked_cudadecon(
                 image=np.asarray(self._data_raw[0].result(),dtype=np.uint16),
                 psf=self._psfs[0, :],
                 image_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
                 psf_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
-                wavelength_um=self._datastore.load_local_wavelengths_um(
-                    tile=self._tile_id,
-                    round=self._round_ids[0])[1],
+                wavelength_um=polyDT_em_wavelength_um,
                 na=self._datastore.na,
                 ri=self._datastore.ri,
                 n_iters=self._decon_iters,
                 background=self._decon_background,
             )
 
-            self._datastore.save_local_registered_image(
+            write_future = self._datastore.save_local_registered_image(
                 ref_image_decon,
                 tile=self._tile_id,
                 deconvolution=True,
-                round=self._round_ids[0]
+                round=self._round_ids[0],
+                return_future=True,
             )
 
         for r_idx, round_id in enumerate(tqdm(self._round_ids[1:],desc="rounds")):
 
-            test =  self._datastore.load_local_registered_image(
-                tile=self._tile_id,
-                round=round_id
-            )
-            if test is None:
+            if self._overwrite_registered:
                 has_reg_decon_data = False
             else:
-                has_reg_decon_data = True
+                test =  self._datastore.load_local_registered_image(
+                    tile=self._tile_id,
+                    round=round_id
+                )
+                has_reg_decon_data = test is not None
 
             if not (has_reg_decon_data) or self._overwrite_registered:
-                try:
-                    temp = ref_image_decon[0:1,0:1,0:1].astype(np.float32)
-                    del temp
-                    gc.collect()
-                except FileNotFoundError :
+                if ref_image_decon is None:
                     ref_image_decon = self._datastore.load_local_registered_image(
                         tile=self._tile_id,
                         round=self._round_ids[0],
@@ -308,6 +331,10 @@ class DataRegistration:
                     )
                 
 
+                # read the next round while this one is registered, and
+                # release this round once it is deconvolved
+                self._request_raw_data(r_idx)
+                self._request_raw_data(r_idx + 1)
                 mov_image_decon = chunked_cudadecon(
                     image=np.asarray(
                         self._data_raw[r_idx].result(),dtype=np.uint16
@@ -315,82 +342,75 @@ class DataRegistration:
                     psf=self._psfs[0, :],
                     image_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
                     psf_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
-                    wavelength_um=float(self._datastore.load_local_wavelengths_um(
-                        tile=self._tile_id,
-                        round=self._round_ids[0])[1]
-                    ),
+                    wavelength_um=polyDT_em_wavelength_um,
                     na=self._datastore.na,
                     ri=self._datastore.ri,
                     n_iters=self._decon_iters,
                     background=self._decon_background,
                 )
+                self._data_raw[r_idx] = None
 
                 downsample_factor = 2
-                if downsample_factor > 1:
-                    ref_image_decon_ds = downsample_image_isotropic(
+                if downsample_factor not in ref_image_decon_ds:
+                    ref_image_decon_ds[downsample_factor] = downsample_image_isotropic(
                         ref_image_decon, downsample_factor
                     )
-                    mov_image_decon_ds = downsample_image_isotropic(
-                        mov_image_decon, downsample_factor
-                    )
-                else:
-                    ref_image_decon_ds = ref_image_decon.copy()
-                    mov_image_decon_ds = mov_image_decon.copy()
+                    if CUCIM_AVAILABLE:
+                        ref_image_decon_ds[downsample_factor] = cp.asarray(
+                            ref_image_decon_ds[downsample_factor]
+                        )
+                mov_image_decon_ds = downsample_image_isotropic(
+                    mov_image_decon, downsample_factor
+                )
 
                 _, initial_xy_shift = compute_rigid_transform(
-                    ref_image_decon_ds,
+                    ref_image_decon_ds[downsample_factor],
                     mov_image_decon_ds,
                     use_mask=True,
                     downsample_factor=downsample_factor,
                     projection="z",
                 )
 
-                intial_xy_transform = sitk.TranslationTransform(3, initial_xy_shift)
-
-                mov_image_decon = apply_transform(
-                    ref_image_decon, mov_image_decon, intial_xy_transform
-                )
+                mov_image_decon = translate_image(mov_image_decon, initial_xy_shift)
 
                 downsample_factor = 2
-                if downsample_factor > 1:
-                    ref_image_decon_ds = downsample_image_isotropic(
+                if downsample_factor not in ref_image_decon_ds:
+                    ref_image_decon_ds[downsample_factor] = downsample_image_isotropic(
                         ref_image_decon, downsample_factor
                     )
-                    mov_image_decon_ds = downsample_image_isotropic(
-                        mov_image_decon, downsample_factor
-                    )
-                else:
-                    ref_image_decon_ds = ref_image_decon.copy()
-                    mov_image_decon_ds = mov_image_decon.copy()
+                    if CUCIM_AVAILABLE:
+                        ref_image_decon_ds[downsample_factor] = cp.asarray(
+                            ref_image_decon_ds[downsample_factor]
+                        )
+                mov_image_decon_ds = downsample_image_isotropic(
+                    mov_image_decon, downsample_factor
+                )
 
                 _, intial_z_shift = compute_rigid_transform(
-                    ref_image_decon_ds,
+                    ref_image_decon_ds[downsample_factor],
                     mov_image_decon_ds,
                     use_mask=False,
                     downsample_factor=downsample_factor,
                     projection="search",
                 )
 
-                intial_z_transform = sitk.TranslationTransform(3, intial_z_shift)
-
-                mov_image_decon = apply_transform(
-                    ref_image_decon, mov_image_decon, intial_z_transform
-                )
+                mov_image_decon = translate_image(mov_image_decon, intial_z_shift)
 
                 downsample_factor = 4
-                if downsample_factor > 1:
-                    ref_image_decon_ds = downsample_image_isotropic(
+                if downsample_factor not in ref_image_decon_ds:
+                    ref_image_decon_ds[downsample_factor] = downsample_image_isotropic(
                         ref_image_decon, downsample_factor
                     )
-                    mov_image_decon_ds = downsample_image_isotropic(
-                        mov_image_decon, downsample_factor
-                    )
-                else:
-                    ref_image_decon_ds = ref_image_decon.copy()
-                    mov_image_decon_ds = mov_image_decon.copy()
+                    if CUCIM_AVAILABLE:
+                        ref_image_decon_ds[downsample_factor] = cp.asarray(
+                            ref_image_decon_ds[downsample_factor]
+                        )
+                mov_image_decon_ds = downsample_image_isotropic(
+                    mov_image_decon, downsample_factor
+                )
 
                 _, xyz_shift_4x = compute_rigid_transform(
-                    ref_image_decon_ds,
+                    ref_image_decon_ds[downsample_factor],
                     mov_image_decon_ds,
                     use_mask=True,
                     downsample_factor=downsample_factor,
@@ -409,23 +429,20 @@ class DataRegistration:
                     round=round_id
                 )
 
-                xyz_transform_4x = sitk.TranslationTransform(3, xyz_shift_4x)
-                mov_image_decon = apply_transform(
-                    ref_image_decon, mov_image_decon, xyz_transform_4x
-                )
+                mov_image_decon = translate_image(mov_image_decon, xyz_shift_4x)
                 
                 if self._perform_optical_flow:
                     downsample_factor = 3
-                    if downsample_factor > 1:
-                        ref_image_decon_ds = downsample_image_isotropic(
+                    if downsample_factor not in ref_image_decon_ds:
+                        ref_image_decon_ds[downsample_factor] = downsample_image_isotropic(
                             ref_image_decon, downsample_factor
                         )
-                        mov_image_decon_ds = downsample_image_isotropic(
-                            mov_image_decon, downsample_factor
-                        )
+                    mov_image_decon_ds = downsample_image_isotropic(
+                        mov_image_decon, downsample_factor
+                    )
 
                     of_xform_px = compute_optical_flow(
-                        ref_image_decon_ds, 
+                        ref_image_decon_ds[downsample_factor], 
                         mov_image_decon_ds
                     )
 
@@ -439,59 +456,53 @@ class DataRegistration:
                         round=round_id
                     )
 
-                    of_xform_sitk = sitk.GetImageFromArray(
-                        of_xform_px.transpose(1, 2, 3, 0).astype(np.float64),
-                        isVector=True,
-                    )
-                    interpolator = sitk.sitkLinear
-                    identity_transform = sitk.Transform(3, sitk.sitkIdentity)
-                    optical_flow_sitk = sitk.Resample(
-                        of_xform_sitk,
-                        sitk.GetImageFromArray(mov_image_decon),
-                        identity_transform,
-                        interpolator,
-                        0,
-                        of_xform_sitk.GetPixelID(),
-                    )
-                    displacement_field = sitk.DisplacementFieldTransform(
-                        optical_flow_sitk
-                    )
-                    del optical_flow_sitk, of_xform_px
-                    gc.collect()
-
                     # apply optical flow
-                    mov_image_sitk = sitk.Resample(
-                        sitk.GetImageFromArray(mov_image_decon), 
-                        displacement_field
+                    data_registered = warp_with_optical_flow(
+                        mov_image_decon, of_xform_px
                     )
-
-                    data_registered = sitk.GetArrayFromImage(
-                        mov_image_sitk
-                    ).astype(np.float32)
-                    data_registered[data_registered < 0.0] = 0
+                    del of_xform_px
+                    np.maximum(data_registered, 0.0, out=data_registered)
                     data_registered = data_registered.astype(np.uint16)
-                    
-                    del mov_image_sitk, displacement_field
                     gc.collect()
                 else:
-                    mov_image_decon[mov_image_decon < 0.0] = 0
+                    np.maximum(mov_image_decon, 0.0, out=mov_image_decon)
                     data_registered = mov_image_decon.astype(np.uint16)
                     
                 if self.save_all_polyDT_registered:
-                    self._datastore.save_local_registered_image(
-                        registered_image=data_registered.astype(np.uint16),
+                    if write_future is not None:
+                        write_future.result()
+                    write_future = self._datastore.save_local_registered_image(
+                        registered_image=data_registered,
                         tile=self._tile_id,
                         deconvolution=True,
-                        round=round_id
+                        round=round_id,
+                        return_future=True,
                     )
 
                 del data_registered
                 gc.collect()
 
+        if write_future is not None:
+            write_future.result()
+        self._data_raw = [None] * len(self._round_ids)
+
     def _apply_registration_to_bits(self):
         """Generate ufish + deconvolved, registered readout data and save to datastore."""
         
-        for bit_idx, bit_id in enumerate(tqdm(self._bit_ids,desc='bits')):
+        # read bit attributes once up front, and the registration transforms
+        # once per round since several bits share a round
+        bits_to_process = {}
+        rigid_xforms_xyz_px = {}
+        of_xforms_px = {}
+        bits_left_in_round = {}
+        for bit_idx, bit_id in enumerate(self._bit_ids):
+            if not self._overwrite_registered:
+                test = self._datastore.load_local_registered_image(
+                    tile=self._tile_id,
+                    bit=bit_id
+                )
+                if test is not None:
+                    continue
 
             r_idx = self._datastore.load_local_round_linker(
                 tile=self._tile_id,
@@ -502,208 +513,234 @@ class DataRegistration:
                 tile=self._tile_id,
                 bit=bit_id
             )
-            
+
             # TO DO: hacky fix. Need to come up with a better way.
             if ex_wavelength_um < 600:
                 psf_idx = 1
             else:
                 psf_idx = 2
 
-            test = self._datastore.load_local_registered_image(
-                tile=self._tile_id,
-                bit=bit_id
-            )
-            
-            if test is None:
-                reg_decon_data_on_disk = False
-            else:
-                reg_decon_data_on_disk = True
-
-
-            if (not (reg_decon_data_on_disk) or self._overwrite_registered):
-                
-                corrected_image = self._datastore.load_local_corrected_image(
-                    tile=self._tile_id,
-                    bit=bit_id,
-                    return_future=False,
-                )
-
-                decon_image = chunked_cudadecon(
-                    image=corrected_image,
-                    psf=self._psfs[psf_idx, :],
-                    image_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
-                    psf_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
-                    wavelength_um=em_wavelength_um,
-                    na=self._datastore.na,
-                    ri=self._datastore.ri,
-                    n_iters=self._decon_iters,
-                    background=self._decon_background,
-                )
-
-
-                if r_idx > 0:
-                    rigid_xform_xyz_um = self._datastore.load_local_rigid_xform_xyz_px(
+            if r_idx > 0:
+                bits_left_in_round[r_idx] = bits_left_in_round.get(r_idx, 0) + 1
+                if not self._perform_optical_flow and r_idx not in rigid_xforms_xyz_px:
+                    rigid_xform_xyz_px = self._datastore.load_local_rigid_xform_xyz_px(
                         tile=self._tile_id,
                         round=self._round_ids[r_idx],
                     )
-                    shift_xyz = [float(i) for i in rigid_xform_xyz_um]
-                    xyz_transform = sitk.TranslationTransform(3, shift_xyz)
-
-                    if self._perform_optical_flow:
-                        
-                        of_xform_px, _ = self._datastore.load_coord_of_xform_px(
+                    rigid_xforms_xyz_px[r_idx] = [float(i) for i in rigid_xform_xyz_px]
+
+            bits_to_process[bit_id] = (bit_idx, r_idx, psf_idx, em_wavelength_um)
+
+        # pipeline bits across two worker threads. GPU stages hold gpu_lock,
+        # so one bit is deconvolved or localized while the other bit is
+        # read, resampled, or written. Threads instead of processes, because
+        # the CUDA contexts and U-FISH weights cannot be shared across
+        # processes.
+        max_workers = 2
+        gpu_lock = threading.Lock()
+        pending_futures = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for bit_id, (bit_idx, r_idx, psf_idx, em_wavelength_um) in tqdm(
+                bits_to_process.items(), desc="bits"
+            ):
+                if len(pending_futures) >= max_workers:
+                    pending_futures.popleft().result()
+                corrected_image_future = self._datastore.load_local_corrected_image(
+                    tile=self._tile_id,
+                    bit=bit_id,
+                    return_future=True,
+                )
+                if (
+                    self._perform_optical_flow
+                    and r_idx > 0
+                    and r_idx not in of_xforms_px
+                ):
+                    # rigid shift and optical flow come from the same round
+                    # attributes, so read them together when the first bit
+                    # of the round is queued
+                    rigid_xform_xyz_px, of_xform_px, _ = (
+                        self._datastore.load_local_registration_xforms(
                             tile=self._tile_id,
                             round=self._round_ids[r_idx],
-                            return_future=False
+                            return_future=False,
                         )
+                    )
+                    rigid_xforms_xyz_px[r_idx] = [float(i) for i in rigid_xform_xyz_px]
+                    of_xforms_px[r_idx] = of_xform_px
+                pending_futures.append(
+                    executor.submit(
+                        self._register_bit,
+                        bit_idx,
+                        bit_id,
+                        r_idx,
+                        psf_idx,
+                        em_wavelength_um,
+                        rigid_xforms_xyz_px.get(r_idx),
+                        of_xforms_px.get(r_idx),
+                        corrected_image_future,
+                        gpu_lock,
+                    )
+                )
+                if r_idx > 0:
+                    # drop the field after the last bit of its round is
+                    # queued, the worker keeps its own reference
+                    bits_left_in_round[r_idx] -= 1
+                    if bits_left_in_round[r_idx] == 0:
+                        of_xforms_px.pop(r_idx, None)
+            while pending_futures:
+                pending_futures.popleft().result()
+
+    def _register_bit(
+        self,
+        bit_idx: int,
+        bit_id: str,
+        r_idx: int,
+        psf_idx: int,
+        em_wavelength_um: float,
+        rigid_xform_xyz_px: Optional[list[float]],
+        of_xform_px: Optional[ArrayLike],
+        corrected_image_future: ArrayLike,
+        gpu_lock: threading.Lock,
+    ):
+        """Deconvolve, register, and localize one readout bit.
 
-                        of_xform_sitk = sitk.GetImageFromArray(
-                            of_xform_px.transpose(1, 2, 3, 0).astype(np.float64),
-                            isVector=True,
-                        )
+        Parameters
+        ----------
+        bit_idx : int
+            Bit index.
+        bit_id : str
+            Bit id.
+        r_idx : int
+            Round index of this bit.
+        psf_idx : int
+            Channel PSF index.
+        em_wavelength_um : float
+            Emission wavelength in microns.
+        rigid_xform_xyz_px : Optional[list[float]]
+            Rigid shift back to the first round. None for the first round.
+        of_xform_px : Optional[ArrayLike]
+            Optical flow field back to the first round. None for the first
+            round or if optical flow is not performed.
+        corrected_image_future : ArrayLike
+            Delayed (future) corrected image for this bit.
+        gpu_lock : threading.Lock
+            Lock held while running GPU or numba-parallel stages.
+        """
 
-                        interpolator = sitk.sitkLinear
-                        identity_transform = sitk.Transform(3, sitk.sitkIdentity)
-                        
-                        optical_flow_sitk = sitk.Resample(
-                            of_xform_sitk,
-                            sitk.GetImageFromArray(decon_image),
-                            identity_transform,
-                            interpolator,
-                            0,
-                            of_xform_sitk.GetPixelID(),
-                        )
-                        displacement_field = sitk.DisplacementFieldTransform(
-                            optical_flow_sitk
-                        )
-                        del optical_flow_sitk, of_xform_px
-                        gc.collect()
+        corrected_image = corrected_image_future.result()
 
-                    decon_image_rigid = apply_transform(
-                        decon_image, 
-                        decon_image, 
-                        xyz_transform
+        with gpu_lock:
+            decon_image = chunked_cudadecon(
+                image=corrected_image,
+                psf=self._psfs[psf_idx, :],
+                image_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
+                psf_voxel_zyx_um=self._datastore.voxel_size_zyx_um,
+                wavelength_um=em_wavelength_um,
+                na=self._datastore.na,
+                ri=self._datastore.ri,
+                n_iters=self._decon_iters,
+                background=self._decon_background,
+            )
+        del corrected_image
+
+        if r_idx > 0:
+            if self._perform_optical_flow:
+                # rigid shift and optical flow share one resampling pass
+                with gpu_lock:
+                    data_decon_registered = warp_with_optical_flow(
+                        decon_image, of_xform_px, shift_xyz=rigid_xform_xyz_px
                     )
-                    del decon_image
+                del decon_image
+            else:
+                xyz_transform = sitk.TranslationTransform(3, rigid_xform_xyz_px)
 
-                    if self._perform_optical_flow:
-                        decon_bit_image_sitk = sitk.Resample(
-                            sitk.GetImageFromArray(decon_image_rigid), 
-                            displacement_field
-                        )
-                        del displacement_field
-
-                        data_decon_registered = sitk.GetArrayFromImage(
-                            decon_bit_image_sitk
-                        ).astype(np.float32)
-                        del decon_bit_image_sitk
-                    else:
-                        data_decon_registered = decon_image_rigid.copy()
-                        del decon_image_rigid
-                    gc.collect()
+                data_decon_registered = apply_transform(
+                    decon_image, 
+                    decon_image, 
+                    xyz_transform
+                )
+                del decon_image
+            gc.collect()
 
-                else:
-                    data_decon_registered = decon_image.copy()
-                    del decon_image
-                    gc.collect()
-                    
-                data_decon_registered[data_decon_registered<0.]=0.0
+        else:
+            # deconvolution returns the input dtype (uint16), while the
+            # registered branches return float32. Match them so the in-place
+            # clip below is valid.
+            data_decon_registered = decon_image.astype(np.float32, copy=False)
+            del decon_image
+            gc.collect()
+            
+        np.maximum(data_decon_registered, 0.0, out=data_decon_registered)
 
-                builtins.print = _no_op
+        with gpu_lock:
+            # silence U-FISH output. redirect_stdout restores sys.stdout
+            # even if U-FISH raises, unlike patching builtins.print.
+            with redirect_stdout(io.StringIO()):
                 ufish = UFish(device="cuda")
                 ufish.load_weights_from_internet()
 
                 ufish_localization, ufish_data = ufish.predict(
                     data_decon_registered, axes="zyx", blend_3d=False, batch_size=1
                 )
-                builtins.print = self._original_print
-
-                ufish_localization = ufish_localization.rename(columns={"axis-0": "z"})
-                ufish_localization = ufish_localization.rename(columns={"axis-1": "y"})
-                ufish_localization = ufish_localization.rename(columns={"axis-2": "x"})
-
-                del ufish
-                gc.collect()
 
-                torch.cuda.empty_cache()
-                cp.get_default_memory_pool().free_all_blocks()
-                gc.collect()
+            ufish_localization = ufish_localization.rename(columns={"axis-0": "z"})
+            ufish_localization = ufish_localization.rename(columns={"axis-1": "y"})
+            ufish_localization = ufish_localization.rename(columns={"axis-2": "x"})
 
-                roi_z, roi_y, roi_x = 7, 5, 5
+            del ufish
+            gc.collect()
 
-                def sum_pixels_in_roi(row, image, roi_dims):
-                    z, y, x = row["z"], row["y"], row["x"]
-                    roi_z, roi_y, roi_x = roi_dims
-                    z_min, y_min, x_min = (
-                        max(0, z - roi_z // 2),
-                        max(0, y - roi_y // 2),
-                        max(0, x - roi_x // 2),
-                    )
-                    z_max, y_max, x_max = (
-                        min(image.shape[0], z_min + roi_z),
-                        min(image.shape[1], y_min + roi_y),
-                        min(image.shape[2], x_min + roi_x),
-                    )
-                    roi = image[
-                        int(z_min) : int(z_max),
-                        int(y_min) : int(y_max),
-                        int(x_min) : int(x_max),
-                    ]
-                    return np.sum(roi)
-
-                ufish_localization["sum_prob_pixels"] = ufish_localization.apply(
-                    sum_pixels_in_roi,
-                    axis=1,
-                    image=ufish_data,
-                    roi_dims=(roi_z, roi_y, roi_x),
-                )
-                ufish_localization["sum_decon_pixels"] = ufish_localization.apply(
-                    sum_pixels_in_roi,
-                    axis=1,
-                    image=data_decon_registered,
-                    roi_dims=(roi_z, roi_y, roi_x),
-                )
+            torch.cuda.empty_cache()
+            cp.get_default_memory_pool().free_all_blocks()
+            gc.collect()
 
-                ufish_localization["tile_idx"] = self._tile_ids.index(self._tile_id)
-                ufish_localization["bit_idx"] = bit_idx + 1
-                ufish_localization["tile_z_px"] = ufish_localization["z"]
-                ufish_localization["tile_y_px"] = ufish_localization["y"]
-                ufish_localization["tile_x_px"] = ufish_localization["x"]
+            # numba's default workqueue threading layer is not thread-safe,
+            # so keep the parallel ROI sums inside the lock
+            roi_dims = (7, 5, 5)
+            spot_coords = ufish_localization[["z", "y", "x"]].to_numpy(
+                dtype=np.float64
+            )
+            ufish_localization["sum_prob_pixels"] = sum_pixels_in_roi(
+                ufish_data, spot_coords, roi_dims
+            )
+            ufish_localization["sum_decon_pixels"] = sum_pixels_in_roi(
+                data_decon_registered, spot_coords, roi_dims
+            )
 
-                self._datastore.save_local_registered_image(
-                    data_decon_registered.astype(np.uint16),
-                    tile=self._tile_id,
-                    deconvolution=True,
-                    bit=bit_id
-                )
-                self._datastore.save_local_ufish_image(
-                    ufish_data,
-                    tile=self._tile_id,
-                    bit=bit_id
-                )
-                self._datastore.save_local_ufish_spots(
-                    ufish_localization,
-                    tile=self._tile_id,
-                    bit=bit_id
-                )
-                
-                del (
-                    data_decon_registered,
-                    ufish_data,
-                    ufish_localization,
-                )
-                gc.collect()
-                
-                
-def _no_op(*args, **kwargs):
-    """Function to monkey patch print to suppress output.
-    
-    Parameters
-    ----------
-    *args
-        Variable length argument list
-    **kwargs
-        Arbitrary keyword arguments
-    """
+        ufish_localization["tile_idx"] = self._tile_ids.index(self._tile_id)
+        ufish_localization["bit_idx"] = bit_idx + 1
+        ufish_localization["tile_z_px"] = ufish_localization["z"]
+        ufish_localization["tile_y_px"] = ufish_localization["y"]
+        ufish_localization["tile_x_px"] = ufish_localization["x"]
 
-    pass
\ No newline at end of file
+        # compress and write both volumes concurrently with the spot table
+        write_futures = [
+            self._datastore.save_local_registered_image(
+                data_decon_registered.astype(np.uint16),
+                tile=self._tile_id,
+                deconvolution=True,
+                bit=bit_id,
+                return_future=True,
+            ),
+            self._datastore.save_local_ufish_image(
+                ufish_data,
+                tile=self._tile_id,
+                bit=bit_id,
+                return_future=True,
+            ),
+        ]
+        self._datastore.save_local_ufish_spots(
+            ufish_localization,
+            tile=self._tile_id,
+            bit=bit_id
+        )
+        for write_future in write_futures:
+            if write_future is not None:
+                write_future.result()
+        
+        del (
+            data_decon_registered,
+            ufish_data,
+            ufish_localization,
+        )
+        gc.collect()
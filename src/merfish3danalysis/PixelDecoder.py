@@ -12,6 +12,10 @@ History:
 """
 
 from merfish3danalysis.qi2labDataStore import qi2labDataStore
+from merfish3danalysis.utils.spatial import (
+    polygons_to_arrays,
+    assign_points_to_polygons,
+)
 import numpy as np
 from pathlib import Path
 import gc
@@ -25,13 +29,14 @@ from typing import Union, Optional, Sequence, Tuple
 import pandas as pd
 from random import sample
 from tqdm import tqdm
-from shapely.geometry import Point, Polygon #noqa
 from roifile import roiread
-import rtree
 from scipy.spatial import cKDTree
 import warnings
 import tempfile
+import os
+import zipfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # filter warning from skimage
 warnings.filterwarnings(
@@ -212,14 +217,18 @@ class PixelDecoder:
             iterable_bits = enumerate(self._datastore.bit_ids)
 
         for bit_idx, bit_id in iterable_bits:
-            all_images = []
+            # sized on the first tile, then each tile is copied straight into
+            # its slot instead of building a list and copying it again
+            all_images = None
 
             if self._verbose >= 1:
-                iterable_tiles = tqdm(random_tiles, desc="loading tiles", leave=False)
+                iterable_tiles = enumerate(
+                    tqdm(random_tiles, desc="loading tiles", leave=False)
+                )
             else:
-                iterable_tiles = random_tiles
+                iterable_tiles = enumerate(random_tiles)
 
-            for tile_id in iterable_tiles:
+            for tile_pos, tile_id in iterable_tiles:
                 decon_image = self._datastore.load_local_registered_image(
                     tile=tile_id, bit=bit_id, return_future=False
                 )
@@ -236,19 +245,19 @@ class PixelDecoder:
                     current_image[current_image.shape[0] // 2, :, :]
                 ).astype(cp.float32)
                 if self._z_crop:
-                    all_images.append(
-                        cp.asnumpy(
-                            current_image[self._z_range[0] : self._z_range[1], :]
-                        ).astype(np.float32)
+                    current_image = current_image[
+                        self._z_range[0] : self._z_range[1], :
+                    ]
+                if all_images is None:
+                    all_images = np.empty(
+                        (len(random_tiles),) + current_image.shape,
+                        dtype=np.float32,
                     )
-                else:
-                    all_images.append(cp.asnumpy(current_image).astype(np.float32))
+                current_image.get(out=all_images[tile_pos])
                 del current_image
                 cp.get_default_memory_pool().free_all_blocks()
                 gc.collect()
 
-            all_images = np.array(all_images)
-
             if self._verbose >= 1:
                 iterable_tiles = enumerate(
                     tqdm(random_tiles, desc="background est.", leave=False)
@@ -292,7 +301,7 @@ class PixelDecoder:
                     cp.asarray(all_images[tile_idx, :], dtype=cp.float32)
                     - background_vector[bit_idx]
                 )
-                current_image[current_image < 0] = 0
+                cp.maximum(current_image, 0, out=current_image)
                 high_cutoff = cp.percentile(current_image, high_percentile_cut)
                 high_pixels.append(
                     current_image[current_image > high_cutoff]
@@ -351,30 +360,21 @@ class PixelDecoder:
             if col.startswith("bit") and col.endswith("_mean_intensity")
         ]
 
-        barcode_intensities = []
-        barcode_background = []
-        for index, row in df_barcodes_loaded_no_blanks.iterrows():
-            selected_columns = [
-                f'bit{row["on_bit_1"]:02d}_mean_intensity',
-                f'bit{row["on_bit_2"]:02d}_mean_intensity',
-                f'bit{row["on_bit_3"]:02d}_mean_intensity',
-                f'bit{row["on_bit_4"]:02d}_mean_intensity',
-            ]
-
-            selected_dict = {
-                col: (row[col] if col in selected_columns else None)
-                for col in bit_columns
-            }
-            not_selected_dict = {
-                col: (row[col] if col not in selected_columns else None)
-                for col in bit_columns
-            }
-
-            barcode_intensities.append(selected_dict)
-            barcode_background.append(not_selected_dict)
+        # mask each barcode's on bits, then split intensities into on-bit
+        # (signal) and off-bit (background) tables with NaN elsewhere
+        bit_numbers = np.array(
+            [int(col[len("bit") : -len("_mean_intensity")]) for col in bit_columns]
+        )
+        on_bits = df_barcodes_loaded_no_blanks[
+            ["on_bit_1", "on_bit_2", "on_bit_3", "on_bit_4"]
+        ].to_numpy()
+        on_bit_mask = (bit_numbers[None, :, None] == on_bits[:, None, :]).any(axis=2)
 
-        df_barcode_intensities = pd.DataFrame(barcode_intensities)
-        df_barcode_background = pd.DataFrame(barcode_background)
+        bit_intensities = df_barcodes_loaded_no_blanks[bit_columns].reset_index(
+            drop=True
+        )
+        df_barcode_intensities = bit_intensities.where(on_bit_mask)
+        df_barcode_background = bit_intensities.mask(on_bit_mask)
 
         df_barcode_intensities = df_barcode_intensities.reindex(
             sorted(df_barcode_intensities.columns), axis=1
@@ -490,9 +490,11 @@ class PixelDecoder:
         else:
             iterable_bits = self._datastore.bit_ids[0 : self._n_merfish_bits]
 
-        images = []
+        # filled in place one bit at a time instead of stacking a list of
+        # masked copies at the end
+        self._image_data = None
         self._em_wvl = []
-        for bit_id in iterable_bits:
+        for bit_pos, bit_id in enumerate(iterable_bits):
             decon_image = self._datastore.load_local_registered_image(
                 tile=self._tile_idx,
                 bit=bit_id,
@@ -501,33 +503,23 @@ class PixelDecoder:
                 tile=self._tile_idx,
                 bit=bit_id,
             )
+            decon_image = decon_image.result()
+            current_mask = ufish_image.result()
 
             if self._z_crop:
-                current_mask = np.asarray(
-                    ufish_image[self._z_range[0] : self._z_range[1], :].result(),
+                decon_image = decon_image[self._z_range[0] : self._z_range[1], :]
+                current_mask = current_mask[self._z_range[0] : self._z_range[1], :]
+
+            if self._image_data is None:
+                self._image_data = np.zeros(
+                    (self._n_merfish_bits,) + decon_image.shape,
                     dtype=np.float32,
                 )
-                images.append(
-                    np.where(
-                        current_mask > ufish_threshold,
-                        np.asarray(
-                            decon_image[
-                                self._z_range[0] : self._z_range[1], :
-                            ].result(),
-                            dtype=np.float32,
-                        ),
-                        0,
-                    )
-                )
-            else:
-                current_mask = np.asarray(ufish_image.result(), dtype=np.float32)
-                images.append(
-                    np.where(
-                        current_mask > ufish_threshold,
-                        np.asarray(decon_image.result(), dtype=np.float32),
-                        0,
-                    )
-                )
+            np.copyto(
+                self._image_data[bit_pos],
+                decon_image,
+                where=current_mask > np.float32(ufish_threshold),
+            )
             self._em_wvl.append(
                 self._datastore.load_local_wavelengths_um(
                     tile=self._tile_idx,
@@ -535,7 +527,6 @@ class PixelDecoder:
                 )[1]
             )
 
-        self._image_data = np.stack(images, axis=0)
         voxel_size_zyx_um = self._datastore.voxel_size_zyx_um
         self._pixel_size = voxel_size_zyx_um[1]
         self._axial_step = voxel_size_zyx_um[0]
@@ -562,9 +553,6 @@ class PixelDecoder:
         self._origin = origin
         self._spacing = spacing
 
-        del images
-        gc.collect()
-
     def _lp_filter(self, sigma=(3, 1, 1)):
         """Apply low-pass filter to the raw data.
         
@@ -1003,12 +991,8 @@ class PixelDecoder:
                 df_barcode["on_bit_2"] = on_bits_indices[1] + 1
                 df_barcode["on_bit_3"] = on_bits_indices[2] + 1
                 df_barcode["on_bit_4"] = on_bits_indices[3] + 1
-                df_barcode["barcode_id"] = df_barcode.apply(
-                    lambda x: (barcode_index + 1), axis=1
-                )
-                df_barcode["gene_id"] = df_barcode.apply(
-                    lambda x: self._gene_ids[barcode_index], axis=1
-                )
+                df_barcode["barcode_id"] = barcode_index + 1
+                df_barcode["gene_id"] = self._gene_ids[barcode_index]
                 df_barcode["tile_idx"] = self._tile_idx
 
                 df_barcode.rename(columns={"centroid-0": "z"}, inplace=True)
@@ -1120,12 +1104,8 @@ class PixelDecoder:
                     df_barcode["on_bit_2"] = on_bits_indices[1] + 1
                     df_barcode["on_bit_3"] = on_bits_indices[2] + 1
                     df_barcode["on_bit_4"] = on_bits_indices[3] + 1
-                    df_barcode["barcode_id"] = df_barcode.apply(
-                        lambda x: (barcode_index + 1), axis=1
-                    )
-                    df_barcode["gene_id"] = df_barcode.apply(
-                        lambda x: self._gene_ids[barcode_index], axis=1
-                    )
+                    df_barcode["barcode_id"] = barcode_index + 1
+                    df_barcode["gene_id"] = self._gene_ids[barcode_index]
                     df_barcode["tile_idx"] = self._tile_idx
 
                     df_barcode["z"] = z_idx
@@ -1286,19 +1266,24 @@ class PixelDecoder:
             tile_files = decoded_dir_path.glob("*.parquet")
             tile_files = sorted(tile_files, key=lambda x: x.name)
 
-            if self._verbose >= 1:
-                iterable_files = tqdm(tile_files, desc="tile", leave=False)
-            else:
-                iterable_files = tile_files
-
-            tile_data = [
-                pd.read_parquet(parquet_file) for parquet_file in iterable_files
-            ]
+            # per-tile reads are independent and parquet decoding releases
+            # the GIL, so read tiles concurrently (map keeps tile order)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                iterable_data = executor.map(pd.read_parquet, tile_files)
+                if self._verbose >= 1:
+                    iterable_data = tqdm(
+                        iterable_data, total=len(tile_files), desc="tile", leave=False
+                    )
+                tile_data = list(iterable_data)
             self._df_barcodes_loaded = pd.concat(tile_data)
         elif self._load_tile_decoding:
-            tile_data = []
-            for tile_id in self._datastore.tile_ids:
-                tile_data.append(self._datastore.load_local_decoded_spots(tile_id))
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                tile_data = list(
+                    executor.map(
+                        self._datastore.load_local_decoded_spots,
+                        self._datastore.tile_ids,
+                    )
+                )
             self._df_barcodes_loaded = pd.concat(tile_data)
         else:
             self._df_filtered_barcodes = (
@@ -1724,9 +1709,84 @@ class PixelDecoder:
             self._barcodes_filtered = True
             print("Insufficient Blank barcodes called for filtering.")
 
-    @staticmethod
-    def _roi_to_shapely(roi):
-        return Polygon(roi.subpixel_coordinates[:, ::-1])
+    # bump when the packed ROI array layout changes
+    _roi_cache_version = 2
+
+    def _load_roi_arrays(
+        self, roi_path: Path
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Load packed ROI arrays, using a sidecar cache next to the ROI file.
+
+        The cache is keyed on the ROI file name, modification time, and size,
+        so it is rebuilt whenever the ROIs are rewritten.
+
+        Parameters
+        ----------
+        roi_path : Path
+            Path to ImageJ ROI zip file.
+
+        Returns
+        -------
+        vertices : np.ndarray
+            [2, n_vertices] closed-ring polygon vertices, y and x rows.
+        vertex_offsets : np.ndarray
+            CSR row pointers into vertices, one row per polygon.
+        bboxes : np.ndarray
+            [n_polygons, 4] float32 (ymin, xmin, ymax, xmax) bounding boxes.
+        """
+
+        roi_stat = roi_path.stat()
+        cache_key = (
+            f"{roi_path.name}:{roi_stat.st_mtime_ns}:{roi_stat.st_size}"
+            f":{self._roi_cache_version}"
+        )
+        cache_path = roi_path.with_suffix(".npz")
+
+        if cache_path.exists():
+            try:
+                with np.load(cache_path) as cache:
+                    if str(cache["cache_key"]) == cache_key:
+                        return (
+                            cache["vertices"],
+                            cache["vertex_offsets"],
+                            cache["bboxes"],
+                        )
+            except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+                # truncated or unreadable cache, rebuild it below
+                pass
+
+        vertices, vertex_offsets, bboxes = polygons_to_arrays(
+            [
+                roi.subpixel_coordinates[:, ::-1]
+                for roi in roiread(roi_path)
+                if roi.subpixel_coordinates.shape[0] >= 3
+            ]
+        )
+
+        # write to a temporary file in the same directory and move it into
+        # place, so an interrupted or concurrent write never leaves a
+        # truncated cache behind
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=cache_path.parent, suffix=".npz.tmp", delete=False
+            ) as temp_file:
+                temp_path = Path(temp_file.name)
+                np.savez(
+                    temp_file,
+                    cache_key=cache_key,
+                    vertices=vertices,
+                    vertex_offsets=vertex_offsets,
+                    bboxes=bboxes,
+                )
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+            if self._verbose > 1:
+                print(f"Failed to cache ROIs: {e}")
+
+        return vertices, vertex_offsets, bboxes
 
     def _assign_cells(self):
         """Assign cells to barcodes using Cellpose ROIs."""
@@ -1740,48 +1800,31 @@ class PixelDecoder:
         )
 
         try:
-            rois = roiread(cellpose_roi_path)
-        except (FileNotFoundError, IOError, ValueError) as e:
+            vertices, vertex_offsets, bboxes = self._load_roi_arrays(cellpose_roi_path)
+        except (FileNotFoundError, IOError, ValueError, zipfile.BadZipFile) as e:
             print(f"Failed to read ROIs: {e}")
             return
+        if bboxes.shape[0] == 0:
+            print("No valid ROIs found.")
+            self._df_filtered_barcodes["cell_id"] = 0
+            return
 
-        shapely_polygons = []
-        for roi in rois:
-            shapely_polygon = self._roi_to_shapely(roi)
-            if shapely_polygon:
-                shapely_polygons.append(shapely_polygon)
-
-        rtree_index = rtree.index.Index()
-        for polygon_idx, polygon in enumerate(shapely_polygons):
-            try:
-                rtree_index.insert(polygon_idx, polygon.bounds)
-            except rtree.RTreeError as e:
-                print(f"Failed to insert polygon into R-tree: {e}")
+        global_y = self._df_filtered_barcodes["global_y"].to_numpy(dtype=np.float64)
+        global_x = self._df_filtered_barcodes["global_x"].to_numpy(dtype=np.float64)
 
-        def check_point(row):
-            """Check if point is within a polygon.
-            
-            Parameters
-            ----------
-            row : pd.Series
-                Row containing global coordinates.
-                
-            Returns
-            -------
-            cell_id : int
-                Cell ID. Returns 0 if not found.
-            """
-            point = Point(row["global_y"], row["global_x"])
-
-            candidate_ids = list(rtree_index.intersection(point.bounds))
-            for candidate_id in candidate_ids:
-                if shapely_polygons[candidate_id].contains(point):
-                    return candidate_id + 1
-            return 0
-
-        self._df_filtered_barcodes["cell_id"] = self._df_filtered_barcodes.apply(
-            check_point, axis=1
+        # barcodes are concatenated tile by tile, so consecutive points already
+        # share grid cells. A Morton or grid sort costs more than it saves here.
+        cell_id = assign_points_to_polygons(
+            global_y, global_x, vertices, vertex_offsets, bboxes
         )
+
+        # smallest unsigned dtype that holds every cell id, including the
+        # +1 offset applied when formatting for Baysor
+        if bboxes.shape[0] < np.iinfo(np.uint16).max:
+            cell_id = cell_id.astype(np.uint16)
+        else:
+            cell_id = cell_id.astype(np.uint32)
+        self._df_filtered_barcodes["cell_id"] = cell_id
         
     def _remove_duplicates_in_tile_overlap(self, radius: float = 0.75):
         """Remove duplicates in tile overlap.
@@ -1794,30 +1837,24 @@ class PixelDecoder:
 
         self._df_filtered_barcodes.reset_index(drop=True, inplace=True)
 
-        coords = self._df_filtered_barcodes[["global_z", "global_y", "global_x"]].values
-        tile_idxs = self._df_filtered_barcodes["tile_idx"].values
+        coords = self._df_filtered_barcodes[["global_z", "global_y", "global_x"]].to_numpy()
+        tile_idxs = self._df_filtered_barcodes["tile_idx"].to_numpy()
+        distance_mean = self._df_filtered_barcodes["distance_mean"].to_numpy()
 
         tree = cKDTree(coords)
-        pairs = tree.query_pairs(radius)
-
-        rows_to_drop = set()
-        distances = []
-        for i, j in pairs:
-            if tile_idxs[i] != tile_idxs[j]:
-                if (
-                    self._df_filtered_barcodes.loc[i, "distance_mean"]
-                    <= self._df_filtered_barcodes.loc[j, "distance_mean"]
-                ):
-                    rows_to_drop.add(j)
-                    distances.append(self._df_filtered_barcodes.loc[j, "distance_mean"])
-                else:
-                    rows_to_drop.add(i)
-                    distances.append(self._df_filtered_barcodes.loc[i, "distance_mean"])
+        pairs = tree.query_pairs(radius, output_type="ndarray")
+        pairs = pairs[tile_idxs[pairs[:, 0]] != tile_idxs[pairs[:, 1]]]
+
+        # in each cross-tile pair, drop the spot with the larger distance metric
+        i, j = pairs[:, 0], pairs[:, 1]
+        pair_drops = np.where(distance_mean[i] <= distance_mean[j], j, i)
+        distances = distance_mean[pair_drops]
+        rows_to_drop = np.unique(pair_drops)
 
         self._df_filtered_barcodes.drop(rows_to_drop, inplace=True)
         self._df_filtered_barcodes.reset_index(drop=True, inplace=True)
 
-        avg_distance = np.mean(distances) if distances else 0
+        avg_distance = np.mean(distances) if len(distances) > 0 else 0
         dropped_count = len(rows_to_drop)
 
         if self._verbose > 1:
@@ -1827,8 +1864,41 @@ class PixelDecoder:
             )
             print("Dropped points: " + str(dropped_count))
 
-    def _display_results(self):
-        """Display results using Napari."""
+    def _display_results(self, preview_path: Optional[Union[str, Path]] = None):
+        """Display results using Napari.
+
+        Parameters
+        ----------
+        preview_path : Optional[Union[str, Path]], default None
+            If given, skip napari and write z max projections of the results
+            to this ImageJ tiff instead. Does not need Qt or a display.
+        """
+
+        if preview_path is not None:
+            from tifffile import imwrite
+
+            layer_names = [
+                "pixels bit " + str(bit_idx + 1)
+                for bit_idx in range(self._scaled_pixel_images.shape[0])
+            ] + ["decoded", "magnitude", "distance"]
+            preview = np.concatenate(
+                [
+                    np.max(self._scaled_pixel_images, axis=1),
+                    np.max(self._decoded_image, axis=0, keepdims=True),
+                    np.max(self._magnitude_image, axis=0, keepdims=True),
+                    np.max(self._distance_image, axis=0, keepdims=True),
+                ],
+                axis=0,
+                dtype=np.float32,
+            )
+            imwrite(
+                preview_path,
+                preview,
+                imagej=True,
+                resolution=(1 / self._pixel_size, 1 / self._pixel_size),
+                metadata={"axes": "CYX", "unit": "um", "Labels": layer_names},
+            )
+            return
 
         import napari
         from qtpy.QtWidgets import QApplication
@@ -1868,8 +1938,8 @@ class PixelDecoder:
 
         napari.run()
 
-    def _cleanup(self):
-        """Cleanup memory."""
+    def _release_image_data(self):
+        """Release the (filtered) bit images used as decoding input."""
         try:
             if self._filter_type == "lp":
                 del self._image_data_lp
@@ -1878,6 +1948,10 @@ class PixelDecoder:
         except AttributeError:
             pass
 
+    def _cleanup(self):
+        """Cleanup memory."""
+        self._release_image_data()
+
         try:
             del (
                 self._scaled_pixel_images,
@@ -1908,6 +1982,7 @@ class PixelDecoder:
         minimum_pixels: Optional[float] = 3.0,
         use_normalization: Optional[bool] = True,
         ufish_threshold: Optional[float] = 0.5,
+        preview_path: Optional[Union[str, Path]] = None,
     ) -> Optional[tuple[np.ndarray, ...]]:
         """Decode one tile.
 
@@ -1931,6 +2006,9 @@ class PixelDecoder:
             Use normalization. 
         ufish_threshold : Optional[float], default 0.5
             Ufish threshold.
+        preview_path : Optional[Union[str, Path]], default None
+            With display_results, write z max projections of the results to
+            this tiff instead of opening napari. For headless runs.
 
         Returns
         -------
@@ -1955,7 +2033,12 @@ class PixelDecoder:
             magnitude_threshold=magnitude_threshold,
         )
         if display_results:
-            self._display_results()
+            if not (return_results or self._optimize_normalization_weights):
+                # the viewer blocks until closed and only shows decoding
+                # outputs, so drop the bit images instead of holding them
+                self._release_image_data()
+                gc.collect()
+            self._display_results(preview_path=preview_path)
         if return_results:
             if self._filter_type == "lp":
                 return (
@@ -9,7 +9,7 @@ __version__ = "0.4.0"
 __author__ = "Douglas Shepherd"
 __email__ = "douglas.shepherd@asu.edu"
 
-from .utils import dataio, imageprocessing, opmtools, registration
+from .utils import dataio, imageprocessing, opmtools, registration, spatial
 from .DataRegistration import DataRegistration
 from .PixelDecoder import PixelDecoder
 from .qi2labDataStore import qi2labDataStore
\ No newline at end of file
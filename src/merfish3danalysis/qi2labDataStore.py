@@ -19,15 +19,20 @@ import tensorstore as ts
 import pandas as pd
 import numpy as np
 import json
+import os
+import re
 from roifile import roiread, roiwrite, ImagejRoi, ROI_TYPE
-from shapely.geometry import Point, Polygon
+from merfish3danalysis.utils.spatial import (
+    polygons_to_arrays,
+    assign_points_to_polygons,
+)
 from collections import defaultdict
 from itertools import product
-from concurrent.futures import TimeoutError
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 # FALLBACK: what should the Zarr error be?
 try:
     from zarr.errors import ZarrError
-except Exception:
+except ImportError:
     ZarrError = Exception
 
 class qi2labDataStore:
@@ -56,6 +61,22 @@ class qi2labDataStore:
             "create": True,
             "delete_existing": False,
         }
+        # registered outputs are rewritten often, so trade some compression
+        # ratio for much faster writes
+        fast_compressor = {
+            "id": "blosc",
+            "cname": "lz4",
+            "clevel": 1,
+            "shuffle": 1,
+        }
+        self._zarrv2_fast_spec = {
+            **self._zarrv2_spec,
+            "metadata": {"compressor": fast_compressor},
+        }
+
+        # polyDT round attributes hold both registration transforms, so keep
+        # them after the first read instead of re-parsing the .zattrs per load
+        self._round_attrs_cache = {}
 
         self._datastore_path = Path(datastore_path)
         if self._datastore_path.exists():
@@ -478,9 +499,24 @@ class qi2labDataStore:
         Return
         ------
         channel_psfs : ArrayLike
-            Channel point spread functions (PSF).
+            Channel point spread functions (PSF). Read from the datastore on
+            first access.
         """
 
+        if getattr(self, "_psfs", None) is None:
+            current_local_zarr_path = str(
+                self._calibrations_zarr_path / Path("psf_data")
+            )
+            if Path(current_local_zarr_path).exists():
+                try:
+                    self._psfs = self._load_from_zarr_array(
+                        kvstore=self._get_kvstore_key(current_local_zarr_path),
+                        spec=self._zarrv2_spec.copy(),
+                        return_future=False,
+                    )
+                except (IOError, OSError, ZarrError):
+                    print("Calibration psfs missing.")
+
         return getattr(self, "_psfs", None)
 
     @channel_psfs.setter
@@ -1030,8 +1066,7 @@ class qi2labDataStore:
             dictionary = {}
         return dictionary
 
-    @staticmethod
-    def _save_to_json(dictionary: dict, dictionary_path: Union[Path, str]):
+    def _save_to_json(self, dictionary: dict, dictionary_path: Union[Path, str]):
         """Save dictionary to json.
 
         Parameters
@@ -1042,9 +1077,35 @@ class qi2labDataStore:
             The path to the JSON file where the data will be saved.
         """
 
+        self._round_attrs_cache.pop(str(dictionary_path), None)
         with open(dictionary_path, "w") as file:
             json.dump(dictionary, file, indent=4)
 
+    def _load_round_attrs(self, tile_id: str, round_id: str) -> dict:
+        """Load polyDT round attributes, reusing earlier reads.
+
+        Parameters
+        ----------
+        tile_id : str
+            Tile id.
+        round_id : str
+            Round id.
+
+        Returns
+        -------
+        attributes : dict
+            Round attributes. Shared with the cache, do not modify.
+        """
+
+        round_path = self._polyDT_root_path / tile_id / f"{round_id}.zarr"
+        zattrs_path = str(round_path / ".zattrs")
+        attributes = self._round_attrs_cache.get(zattrs_path)
+        if attributes is None:
+            attributes = self._load_from_json(zattrs_path)
+            if attributes:
+                self._round_attrs_cache[zattrs_path] = attributes
+        return attributes
+
     @staticmethod
     def _load_from_microjson(dictionary_path: Union[Path, str]) -> dict:
         """Load cell outlines outlines microjson as dictionary.
@@ -1084,9 +1145,16 @@ class qi2labDataStore:
             Zarr specification.
         """
 
+        # reading does not depend on the codec, so do not constrain it
+        metadata = {
+            key: value
+            for key, value in spec["metadata"].items()
+            if key != "compressor"
+        }
         current_zarr = ts.open(
             {
                 **spec,
+                "metadata": metadata,
                 "kvstore": kvstore,
             }
         ).result()
@@ -1116,9 +1184,16 @@ class qi2labDataStore:
             Delayed (future) or immediate array.
         """
 
+        # reading does not depend on the codec, so do not constrain it
+        metadata = {
+            key: value
+            for key, value in spec["metadata"].items()
+            if key != "compressor"
+        }
         current_zarr = ts.open(
             {
                 **spec,
+                "metadata": metadata,
                 "kvstore": kvstore,
             }
         ).result()
@@ -1130,6 +1205,68 @@ class qi2labDataStore:
         else:
             return read_future.result()
 
+    @staticmethod
+    def _sorted_dir_ids(path: Path, prefix: str) -> list[str]:
+        """List subdirectory ids sorted by their integer index.
+
+        Parameters
+        ----------
+        path : Path
+            Directory to scan.
+        prefix : str
+            Id prefix before the integer index, e.g. "tile" or "round".
+
+        Returns
+        -------
+        dir_ids : list[str]
+            Subdirectory names without extension, sorted by integer index.
+        """
+
+        # parse each index once instead of slicing strings per comparison
+        index_pattern = re.compile(rf"{prefix}(\d+)")
+        keyed_ids = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dir_id = entry.name.split(".")[0]
+                    keyed_ids.append(
+                        (int(index_pattern.search(dir_id).group(1)), dir_id)
+                    )
+
+        return [dir_id for _, dir_id in sorted(keyed_ids)]
+
+    @staticmethod
+    def _compute_chunk_shape(
+        shape: Sequence[int],
+        itemsize: int,
+        target_bytes: int = 4 * 1024**2,
+    ) -> list[int]:
+        """Compute a near-cubic zarr chunk shape.
+
+        Halves the largest chunk axis until one chunk fits in target_bytes.
+
+        Parameters
+        ----------
+        shape : Sequence[int]
+            Array shape.
+        itemsize : int
+            Bytes per array element.
+        target_bytes : int, default 4 * 1024**2
+            Maximum bytes per chunk.
+
+        Returns
+        -------
+        chunks : list[int]
+            Chunk shape.
+        """
+
+        chunks = [int(dim) for dim in shape]
+        while int(np.prod(chunks)) * itemsize > target_bytes and max(chunks) > 1:
+            axis = int(np.argmax(chunks))
+            chunks[axis] = (chunks[axis] + 1) // 2
+
+        return chunks
+
     @staticmethod
     def _save_to_zarr_array(
         array: ArrayLike,
@@ -1163,6 +1300,8 @@ class qi2labDataStore:
             array_dtype = "<u1"
         elif str(array.dtype) == "uint16":
             array_dtype = "<u2"
+        elif str(array.dtype) == "int16":
+            array_dtype = "<i2"
         elif str(array.dtype) == "float16":
             array_dtype = "<f2"
         elif str(array.dtype) == "float32":
@@ -1171,23 +1310,37 @@ class qi2labDataStore:
             print("Unsupported data type: " + str(array.dtype))
             return None
 
-        # check array dimension
+        # check array dimension. copy metadata so the shared spec is not
+        # modified for later loads
+        spec = {**spec, "metadata": {**spec["metadata"]}}
         spec["metadata"]["shape"] = array.shape
         if len(array.shape) == 2:
             spec["metadata"]["chunks"] = [array.shape[0], array.shape[1]]
-        elif len(array.shape) == 3:
-            spec["metadata"]["chunks"] = [1, array.shape[1], array.shape[2]]
-        elif len(array.shape) == 4:
-            spec["metadata"]["chunks"] = [1, 1, array.shape[1], array.shape[2]]
+        else:
+            spec["metadata"]["chunks"] = qi2labDataStore._compute_chunk_shape(
+                array.shape, array.dtype.itemsize
+            )
         spec["metadata"]["dtype"] = array_dtype
 
         try:
-            current_zarr = ts.open(
-                {
-                    **spec,
-                    "kvstore": kvstore,
-                }
-            ).result()
+            try:
+                current_zarr = ts.open(
+                    {
+                        **spec,
+                        "kvstore": kvstore,
+                    }
+                ).result()
+            except ValueError:
+                # existing array written with a different chunk layout or
+                # codec, keep its layout
+                del spec["metadata"]["chunks"]
+                spec["metadata"].pop("compressor", None)
+                current_zarr = ts.open(
+                    {
+                        **spec,
+                        "kvstore": kvstore,
+                    }
+                ).result()
 
             write_future = current_zarr.write(array)
 
@@ -1200,13 +1353,19 @@ class qi2labDataStore:
             print("Error writing zarr array.")
 
     @staticmethod
-    def _load_from_parquet(parquet_path: Union[Path, str]) -> pd.DataFrame:
+    def _load_from_parquet(
+        parquet_path: Union[Path, str],
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
         """Load dataframe from parquet.
         
         Parameters
         ----------
         parquet_path : Union[Path, str]
             Path to parquet file.
+        columns : Optional[Sequence[str]], default None
+            Columns to read. Other column chunks are skipped on disk.
+            If None, read all columns.
             
         Returns
         -------
@@ -1214,7 +1373,7 @@ class qi2labDataStore:
             Dataframe from parquet file.
         """
 
-        return pd.read_parquet(parquet_path)
+        return pd.read_parquet(parquet_path, columns=columns)
 
     @staticmethod
     def _save_to_parquet(df: pd.DataFrame, parquet_path: Union[Path, str]):
@@ -1230,6 +1389,52 @@ class qi2labDataStore:
 
         df.to_parquet(parquet_path)
 
+    def _check_local_registered_round(self, tile_id: str, round_id: str):
+        """Validate local registration outputs for one polyDT round.
+
+        Parameters
+        ----------
+        tile_id : str
+            Tile id.
+        round_id : str
+            Round id.
+        """
+
+        round_path = self._polyDT_root_path / tile_id / f"{round_id}.zarr"
+
+        if round_id is not self._round_ids[0]:
+            attributes = self._load_round_attrs(tile_id, round_id)
+            if not attributes:
+                print("polyDT tile attributes not found")
+
+            keys_to_check = ["rigid_xform_xyz_px"]
+
+            for key in keys_to_check:
+                if key not in attributes.keys():
+                    raise KeyError("Rigid registration missing")
+
+            current_local_zarr_path = str(round_path / "of_xform_px")
+
+            try:
+                self._check_for_zarr_array(
+                    self._get_kvstore_key(current_local_zarr_path),
+                    self._zarrv2_spec.copy(),
+                )
+            except (IOError, OSError, ZarrError):
+                print(tile_id, round_id)
+                print("Optical flow registration data missing.")
+
+        current_local_zarr_path = str(round_path / "registered_decon_data")
+        if round_id is self._round_ids[0]:
+            try:
+                self._check_for_zarr_array(
+                    self._get_kvstore_key(current_local_zarr_path),
+                    self._zarrv2_spec.copy(),
+                )
+            except (IOError, OSError, ZarrError):
+                print(tile_id, round_id)
+                print("Registered polyDT data missing.")
+
     def _parse_datastore(self):
         """Parse datastore to discover available components."""
 
@@ -1289,14 +1494,9 @@ class qi2labDataStore:
                 self._calibrations_zarr_path / Path("psf_data")
             )
 
-            try:
-                self._psfs = (
-                    self._load_from_zarr_array(
-                        kvstore=self._get_kvstore_key(current_local_zarr_path),
-                        spec=self._zarrv2_spec.copy(),
-                    )
-                ).result()
-            except (IOError, OSError, ZarrError):
+            # psfs are only needed for deconvolution, so they are read on
+            # first access of channel_psfs instead of on every datastore open
+            if not Path(current_local_zarr_path).exists():
                 print("Calibration psfs missing.")
 
             del current_local_zarr_path
@@ -1320,46 +1520,26 @@ class qi2labDataStore:
             if not (self._polyDT_root_path.exists()):
                 raise FileNotFoundError("PolyDT directory not initialized")
             else:
-                polyDT_tile_ids = sorted(
-                    [
-                        entry.name
-                        for entry in self._polyDT_root_path.iterdir()
-                        if entry.is_dir()
-                    ],
-                    key=lambda x: int(x.split("tile")[1].split(".zarr")[0]),
+                polyDT_tile_ids = self._sorted_dir_ids(
+                    self._polyDT_root_path, "tile"
                 )
                 current_tile_dir_path = self._polyDT_root_path / Path(
                     polyDT_tile_ids[0]
                 )
-                self._round_ids = sorted(
-                    [
-                        entry.name.split(".")[0]
-                        for entry in current_tile_dir_path.iterdir()
-                        if entry.is_dir()
-                    ],
-                    key=lambda x: int(x.split("round")[1].split(".zarr")[0]),
+                self._round_ids = self._sorted_dir_ids(
+                    current_tile_dir_path, "round"
                 )
             if not (self._readouts_root_path.exists()):
                 raise FileNotFoundError("Readout directory not initialized")
             else:
-                readout_tile_ids = sorted(
-                    [
-                        entry.name
-                        for entry in self._readouts_root_path.iterdir()
-                        if entry.is_dir()
-                    ],
-                    key=lambda x: int(x.split("tile")[1].split(".zarr")[0]),
+                readout_tile_ids = self._sorted_dir_ids(
+                    self._readouts_root_path, "tile"
                 )
                 current_tile_dir_path = self._readouts_root_path / Path(
                     readout_tile_ids[0]
                 )
-                self._bit_ids = sorted(
-                    [
-                        entry.name.split(".")[0]
-                        for entry in current_tile_dir_path.iterdir()
-                        if entry.is_dir()
-                    ],
-                    key=lambda x: int(x.split("bit")[1].split(".zarr")[0]),
+                self._bit_ids = self._sorted_dir_ids(
+                    current_tile_dir_path, "bit"
                 )
             assert (
                 polyDT_tile_ids == readout_tile_ids
@@ -1368,15 +1548,10 @@ class qi2labDataStore:
             del polyDT_tile_ids, readout_tile_ids
 
             for tile_id, round_id in product(self._tile_ids, self._round_ids):
-                try:
-                    zattrs_path = str(
-                        self._polyDT_root_path
-                        / Path(tile_id)
-                        / Path(round_id + ".zarr")
-                        / Path(".zattrs")
-                    )
-                    attributes = self._load_from_json(zattrs_path)
-                except (FileNotFoundError, json.JSONDecodeError):
+                round_path = self._polyDT_root_path / tile_id / f"{round_id}.zarr"
+                # parsed once here, then reused by the per-round loaders
+                attributes = self._load_round_attrs(tile_id, round_id)
+                if not attributes:
                     print("polyDT tile attributes not found")
 
                 keys_to_check = [
@@ -1393,12 +1568,7 @@ class qi2labDataStore:
                         print(tile_id, round_id, key)
                         raise KeyError("Corrected polyDT attributes incomplete")
 
-                current_local_zarr_path = str(
-                    self._polyDT_root_path
-                    / Path(tile_id)
-                    / Path(round_id + ".zarr")
-                    / Path("corrected_data")
-                )
+                current_local_zarr_path = str(round_path / "corrected_data")
 
                 try:
                     self._check_for_zarr_array(
@@ -1410,13 +1580,9 @@ class qi2labDataStore:
                     print("Corrected polyDT data missing.")
 
             for tile_id, bit_id in product(self._tile_ids, self._bit_ids):
+                bit_path = self._readouts_root_path / tile_id / f"{bit_id}.zarr"
                 try:
-                    zattrs_path = str(
-                        self._readouts_root_path
-                        / Path(tile_id)
-                        / Path(bit_id + ".zarr")
-                        / Path(".zattrs")
-                    )
+                    zattrs_path = str(bit_path / ".zattrs")
                     attributes = self._load_from_json(zattrs_path)
                 except (FileNotFoundError, json.JSONDecodeError):
                     print("Readout tile attributes not found")
@@ -1432,12 +1598,7 @@ class qi2labDataStore:
                     if key not in attributes.keys():
                         raise KeyError("Corrected readout attributes incomplete")
 
-                current_local_zarr_path = str(
-                    self._readouts_root_path
-                    / Path(tile_id)
-                    / Path(bit_id + ".zarr")
-                    / Path("corrected_data")
-                )
+                current_local_zarr_path = str(bit_path / "corrected_data")
 
                 try:
                     self._check_for_zarr_array(
@@ -1450,65 +1611,21 @@ class qi2labDataStore:
 
         # check and validate local registered data
         if self._datastore_state["LocalRegistered"]:
-            for tile_id, round_id in product(self._tile_ids, self._round_ids):
-                if round_id is not self._round_ids[0]:
-                    try:
-                        zattrs_path = str(
-                            self._polyDT_root_path
-                            / Path(tile_id)
-                            / Path(round_id + ".zarr")
-                            / Path(".zattrs")
-                        )
-                        with open(zattrs_path, "r") as f:
-                            attributes = json.load(f)
-                    except (FileNotFoundError, json.JSONDecodeError):
-                        print("polyDT tile attributes not found")
-
-                    keys_to_check = ["rigid_xform_xyz_px"]
-
-                    for key in keys_to_check:
-                        if key not in attributes.keys():
-                            raise KeyError("Rigid registration missing")
-
-                    current_local_zarr_path = str(
-                        self._polyDT_root_path
-                        / Path(tile_id)
-                        / Path(round_id + ".zarr")
-                        / Path("of_xform_px")
+            # each (tile, round) check is a handful of small file reads, so
+            # run them concurrently instead of paying the latency serially
+            tile_round_ids = list(product(self._tile_ids, self._round_ids))
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                # consume the results so validation errors are raised here
+                list(
+                    executor.map(
+                        self._check_local_registered_round,
+                        *zip(*tile_round_ids),
                     )
-
-                    try:
-                        self._check_for_zarr_array(
-                            self._get_kvstore_key(current_local_zarr_path),
-                            self._zarrv2_spec.copy(),
-                        )
-                    except (IOError, OSError, ZarrError):
-                        print(tile_id, round_id)
-                        print("Optical flow registration data missing.")
-
-                current_local_zarr_path = str(
-                    self._polyDT_root_path
-                    / Path(tile_id)
-                    / Path(round_id + ".zarr")
-                    / Path("registered_decon_data")
                 )
-                if round_id is self._round_ids[0]:
-                    try:
-                        self._check_for_zarr_array(
-                            self._get_kvstore_key(current_local_zarr_path),
-                            self._zarrv2_spec.copy(),
-                        )
-                    except (IOError, OSError, ZarrError):
-                        print(tile_id, round_id)
-                        print("Registered polyDT data missing.")
 
             for tile_id, bit_id in product(self._tile_ids, self._bit_ids):
-                current_local_zarr_path = str(
-                    self._readouts_root_path
-                    / Path(tile_id)
-                    / Path(bit_id + ".zarr")
-                    / Path("registered_decon_data")
-                )
+                bit_path = self._readouts_root_path / tile_id / f"{bit_id}.zarr"
+                current_local_zarr_path = str(bit_path / "registered_decon_data")
 
                 try:
                     self._check_for_zarr_array(
@@ -1516,15 +1633,10 @@ class qi2labDataStore:
                         self._zarrv2_spec.copy(),
                     )
                 except (IOError, OSError, ZarrError):
-                    print(tile_id, round_id)
+                    print(tile_id, bit_id)
                     print("Registered readout data missing.")
 
-                current_local_zarr_path = str(
-                    self._readouts_root_path
-                    / Path(tile_id)
-                    / Path(bit_id + ".zarr")
-                    / Path("registered_ufish_data")
-                )
+                current_local_zarr_path = str(bit_path / "registered_ufish_data")
 
                 try:
                     self._check_for_zarr_array(
@@ -1532,14 +1644,12 @@ class qi2labDataStore:
                         self._zarrv2_spec.copy(),
                     )
                 except (IOError, OSError, ZarrError):
-                    print(tile_id, round_id)
+                    print(tile_id, bit_id)
                     print("Registered ufish prediction missing.")
 
             for tile_id, bit_id in product(self._tile_ids, self._bit_ids):
                 current_ufish_path = (
-                    self._ufish_localizations_root_path
-                    / Path(tile_id)
-                    / Path(bit_id + ".parquet")
+                    self._ufish_localizations_root_path / tile_id / f"{bit_id}.parquet"
                 )
                 if not (current_ufish_path.exists()):
                     raise FileNotFoundError(
@@ -1549,16 +1659,8 @@ class qi2labDataStore:
         # check and validate global registered data
         if self._datastore_state["GlobalRegistered"]:
             for tile_id in self._tile_ids:
-                try:
-                    zattrs_path = str(
-                        self._polyDT_root_path
-                        / Path(tile_id)
-                        / Path(self._round_ids[0] + ".zarr")
-                        / Path(".zattrs")
-                    )
-                    with open(zattrs_path, "r") as f:
-                        attributes = json.load(f)
-                except (FileNotFoundError, json.JSONDecodeError):
+                attributes = self._load_round_attrs(tile_id, self._round_ids[0])
+                if not attributes:
                     print("polyDT tile attributes not found")
 
                 keys_to_check = ["affine_zyx_um", "origin_zyx_um", "spacing_zyx_um"]
@@ -1747,14 +1849,13 @@ class qi2labDataStore:
         try:
             polyDT_tile_path = self._polyDT_root_path / Path(tile_id)
             polyDT_tile_path.mkdir()
+            bit_linkers = self._experiment_order.to_numpy()[:, 1:].astype(int)
             for round_idx, round_id in enumerate(self._round_ids):
                 polyDT_round_path = polyDT_tile_path / Path(round_id + ".zarr")
                 polyDT_round_path.mkdir()
                 polydt_round_attrs_path = polyDT_round_path / Path(".zattrs")
                 round_attrs = {
-                    "bit_linker": self._experiment_order.to_numpy()[round_idx, 1:]
-                    .astype(int)
-                    .tolist(),
+                    "bit_linker": bit_linkers[round_idx].tolist(),
                 }
                 self._save_to_json(round_attrs, polydt_round_attrs_path)
         except FileExistsError:
@@ -1763,32 +1864,38 @@ class qi2labDataStore:
         try:
             readout_tile_path = self._readouts_root_path / Path(tile_id)
             readout_tile_path.mkdir()
+
+            # map every bit to its fiducial round in one vectorized pass. If a
+            # bit is listed more than once, the first round listing it wins.
+            fiducial_channel = str(self._channels_in_data[0])
+            if len(self._channels_in_data) == 3:
+                readout_channels = [
+                    str(self._channels_in_data[1]),
+                    str(self._channels_in_data[2]),
+                ]
+            else:
+                readout_channels = [str(self._channels_in_data[1])]
+            readout_bits = self._experiment_order[readout_channels].to_numpy()
+            fiducial_rounds = np.repeat(
+                self._experiment_order[fiducial_channel].to_numpy(),
+                len(readout_channels),
+            )
+            linked_bits, first_idx = np.unique(
+                readout_bits.ravel(), return_index=True
+            )
+            round_linkers = dict(
+                zip(
+                    linked_bits.astype(int).tolist(),
+                    fiducial_rounds[first_idx].astype(int).tolist(),
+                )
+            )
+
             for bit_idx, bit_id in enumerate(self._bit_ids):
                 readout_bit_path = readout_tile_path / Path(bit_id + ".zarr")
                 readout_bit_path.mkdir()
                 readout_bit_attrs_path = readout_bit_path / Path(".zattrs")
-                fiducial_channel = str(self._channels_in_data[0])
-                readout_one_channel = str(self._channels_in_data[1])
-
-                if len(self._channels_in_data) == 3:
-                    readout_two_channel = str(self._channels_in_data[2])
-                    condition_one = self._experiment_order[readout_one_channel] == (
-                        bit_idx + 1
-                    )
-                    condition_two = self._experiment_order[readout_two_channel] == (
-                        bit_idx + 1
-                    )
-                    combined_condition = condition_one | condition_two
 
-                else:
-                    combined_condition = self._experiment_order[
-                        readout_one_channel
-                    ] == (bit_idx + 1)
-                matching_rows = self._experiment_order.loc[combined_condition]
-
-                bit_attrs = {
-                    "round_linker": int(matching_rows[fiducial_channel].values[0])
-                }
+                bit_attrs = {"round_linker": round_linkers[bit_idx + 1]}
                 self._save_to_json(bit_attrs, readout_bit_attrs_path)
         except FileExistsError:
             print("Error creating readout tile. Does it exist already?")
@@ -1846,13 +1953,7 @@ class qi2labDataStore:
             return None
 
         try:
-            zattrs_path = str(
-                self._polyDT_root_path
-                / Path(tile_id)
-                / Path(round_id + ".zarr")
-                / Path(".zattrs")
-            )
-            attributes = self._load_from_json(zattrs_path)
+            attributes = self._load_round_attrs(tile_id, round_id)
             return attributes["bits"][1:]
         except (FileNotFoundError, json.JSONDecodeError):
             print(tile_id, round_id)
@@ -2110,13 +2211,7 @@ class qi2labDataStore:
             return None
 
         try:
-            zattrs_path = str(
-                self._polyDT_root_path
-                / Path(tile_id)
-                / Path(round_id + ".zarr")
-                / Path(".zattrs")
-            )
-            attributes = self._load_from_json(zattrs_path)
+            attributes = self._load_round_attrs(tile_id, round_id)
             return np.asarray(attributes["stage_zyx_um"], dtype=np.float32),\
                 np.asarray(attributes["affine_zyx_px"], dtype=np.float32)
         except FileNotFoundError:
@@ -2486,8 +2581,10 @@ class qi2labDataStore:
             return None
 
         try:
-            spec = self._zarrv2_spec.copy()
-            spec["metadata"]["dtype"] = "<u2"
+            spec = {
+                **self._zarrv2_spec,
+                "metadata": {**self._zarrv2_spec["metadata"], "dtype": "<u2"},
+            }
             corrected_image = self._load_from_zarr_array(
                 self._get_kvstore_key(current_local_zarr_path),
                 spec,
@@ -2680,19 +2777,34 @@ class qi2labDataStore:
         else:
             print("'round' must be integer index or string identifier")
             return None
+
+        return self._read_local_rigid_xform_xyz_px(tile_id, round_id)
+
+    def _read_local_rigid_xform_xyz_px(
+        self, tile_id: str, round_id: str
+    ) -> Optional[ArrayLike]:
+        """Read rigid registration transform for validated tile and round ids.
+
+        Parameters
+        ----------
+        tile_id : str
+            Tile id.
+        round_id : str
+            Round id.
+
+        Returns
+        -------
+        rigid_xform_xyz_px : Optional[ArrayLike]
+            Local rigid registration transform for one round and tile.
+        """
+
         try:
-            zattrs_path = str(
-                self._polyDT_root_path
-                / Path(tile_id)
-                / Path(round_id + ".zarr")
-                / Path(".zattrs")
-            )
-            attributes = self._load_from_json(zattrs_path)
+            attributes = self._load_round_attrs(tile_id, round_id)
             rigid_xform_xyz_px = np.asarray(
                 attributes["rigid_xform_xyz_px"], dtype=np.float32
             )
             return rigid_xform_xyz_px
-        except (FileNotFoundError, json.JSONDecodeError):
+        except KeyError:
             print(tile_id, round_id)
             print("Rigid transform mapping back to first round not found.")
             return None
@@ -2780,7 +2892,8 @@ class qi2labDataStore:
         round : Optional[Union[int, str]]
             Round index or round id.
         return_future : Optional[bool]
-            Return future array.
+            Return future array. Quantized (int16) fields are always read
+            immediately and returned dequantized as float32.
             
         Returns
         -------
@@ -2822,52 +2935,84 @@ class qi2labDataStore:
             print("'round' must be integer index or string identifier")
             return None
 
+        return self._read_coord_of_xform_px(tile_id, round_id, return_future)
+
+    def _read_coord_of_xform_px(
+        self,
+        tile_id: str,
+        round_id: str,
+        return_future: bool,
+        missing_ok: bool = False,
+    ) -> Optional[tuple[ArrayLike, ArrayLike]]:
+        """Read optical flow field for validated tile and round ids.
+
+        Parameters
+        ----------
+        tile_id : str
+            Tile id.
+        round_id : str
+            Round id.
+        return_future : bool
+            Return future array. Quantized fields are always read immediately.
+        missing_ok : bool, default False
+            Return None without a message if no optical flow field was saved.
+
+        Returns
+        -------
+        of_xform_px : Optional[ArrayLike]
+            Local fidicual optical flow matrix for one round and tile.
+        downsampling : Optional[ArrayLike]
+            Downsampling factor.
+        """
+
         current_local_zarr_path = str(
             self._polyDT_root_path
             / Path(tile_id)
             / Path(round_id + ".zarr")
             / Path("of_xform_px")
         )
-        zattrs_path = str(
-            self._polyDT_root_path
-            / Path(tile_id)
-            / Path(round_id + ".zarr")
-            / Path(".zattrs")
-        )
 
         if not Path(current_local_zarr_path).exists():
-            print("Optical flow transform mapping back to first round not found.")
+            if not missing_ok:
+                print("Optical flow transform mapping back to first round not found.")
             return None
 
         try:
-            compressor = {
-                "id": "blosc",
-                "cname": "zstd",
-                "clevel": 5,
-                "shuffle": 2,
-            }
-            spec_of = {
-                "driver": "zarr",
-                "kvstore": None,
-                "metadata": {"compressor": compressor},
-                "open": True,
-                "assume_metadata": False,
-                "create": True,
-                "delete_existing": False,
-            }
-            spec_of["metadata"]["dtype"] = "<f4"
-            of_xform_px = self._load_from_zarr_array(
-                self._get_kvstore_key(current_local_zarr_path),
-                spec_of.copy(),
-                return_future,
-            )
-            attributes = self._load_from_json(zattrs_path)
+            attributes = self._load_round_attrs(tile_id, round_id)
             downsampling = np.asarray(
                 attributes["opticalflow_downsampling"], dtype=np.float32
             )
+            spec_of = {
+                **self._zarrv2_spec,
+                "metadata": {**self._zarrv2_spec["metadata"]},
+            }
+            if "opticalflow_scale" in attributes:
+                # quantized field, dequantize with the per-axis scale
+                spec_of["metadata"]["dtype"] = "<i2"
+                of_xform_px = self._load_from_zarr_array(
+                    self._get_kvstore_key(current_local_zarr_path),
+                    spec_of,
+                    False,
+                )
+                scale = np.asarray(
+                    attributes["opticalflow_scale"], dtype=np.float32
+                )
+                # single pass straight from int16 into the float32 output
+                of_xform_px = np.multiply(
+                    of_xform_px,
+                    (1.0 / scale).reshape(-1, *([1] * (of_xform_px.ndim - 1))),
+                    dtype=np.float32,
+                )
+            else:
+                spec_of["metadata"]["dtype"] = "<f4"
+                of_xform_px = self._load_from_zarr_array(
+                    self._get_kvstore_key(current_local_zarr_path),
+                    spec_of,
+                    return_future,
+                )
 
             return of_xform_px, downsampling
-        except (IOError, OSError, ZarrError) as e:
+        except (KeyError, OSError, ValueError, ZarrError) as e:
             print(e)
             print("Error loading optical flow transform.")
             return None
@@ -2881,6 +3026,9 @@ class qi2labDataStore:
         return_future: Optional[bool] = False,
     ):
         """Save fidicual optical flow matrix for one round and tile.
+
+        The matrix is stored as int16 with a per-axis scale factor in the
+        round attributes.
         
         Parameters
         ----------
@@ -2940,35 +3088,113 @@ class qi2labDataStore:
             / Path(".zattrs")
         )
 
+        # flow magnitudes are bounded to a few voxels, so store int16 with a
+        # per-axis scale to halve the bytes written and re-read
+        of_xform_px = np.asarray(of_xform_px, dtype=np.float32)
+        max_abs = np.abs(of_xform_px).reshape(of_xform_px.shape[0], -1).max(axis=1)
+        scale = np.ones_like(max_abs)
+        scale[max_abs > 0] = 32000.0 / max_abs[max_abs > 0]
+        of_xform_px_int16 = np.round(
+            of_xform_px * scale.reshape(-1, *([1] * (of_xform_px.ndim - 1)))
+        ).astype(np.int16)
+
         try:
-            compressor = {
-                "id": "blosc",
-                "cname": "zstd",
-                "clevel": 5,
-                "shuffle": 2,
-            }
+            # replace any existing field, it may be stored as float32
             spec_of = {
-                "driver": "zarr",
-                "kvstore": None,
-                "metadata": {"compressor": compressor},
-                "open": True,
-                "assume_metadata": False,
-                "create": True,
-                "delete_existing": False,
+                **self._zarrv2_fast_spec,
+                "open": False,
+                "delete_existing": True,
             }
             self._save_to_zarr_array(
-                of_xform_px,
+                of_xform_px_int16,
                 self._get_kvstore_key(current_local_zarr_path),
-                spec_of.copy(),
+                spec_of,
                 return_future,
             )
             attributes = self._load_from_json(current_local_zattrs_path)
             attributes["opticalflow_downsampling"] = downsampling
+            attributes["opticalflow_scale"] = scale.tolist()
             self._save_to_json(attributes, current_local_zattrs_path)
         except (IOError, OSError, TimeoutError):
             print("Error saving optical flow transform.")
             return None
 
+    def load_local_registration_xforms(
+        self,
+        tile: Union[int, str],
+        round: Union[int, str],
+        return_future: Optional[bool] = True,
+    ) -> Optional[tuple[ArrayLike, Optional[ArrayLike], Optional[ArrayLike]]]:
+        """Load rigid and optical flow registration for one round and tile.
+
+        Both transforms are described by the same round attributes, so they
+        are read together in one pass.
+
+        Parameters
+        ----------
+        tile : Union[int, str]
+            Tile index or tile id.
+        round : Union[int, str]
+            Round index or round id.
+        return_future : Optional[bool]
+            Return future optical flow array. Quantized (int16) fields are
+            always read immediately and returned dequantized as float32.
+
+        Returns
+        -------
+        rigid_xform_xyz_px : ArrayLike
+            Local rigid registration transform for one round and tile.
+        of_xform_px : Optional[ArrayLike]
+            Local fidicual optical flow matrix for one round and tile. None if
+            optical flow was not run.
+        downsampling : Optional[ArrayLike]
+            Optical flow downsampling factor. None if optical flow was not run.
+        """
+
+        if isinstance(tile, int):
+            if tile < 0 or tile > self._num_tiles:
+                print("Set tile index >=0 and <=" + str(self._num_tiles))
+                return None
+            else:
+                tile_id = self._tile_ids[tile]
+        elif isinstance(tile, str):
+            if tile not in self._tile_ids:
+                print("set valid tiled id")
+                return None
+            else:
+                tile_id = tile
+        else:
+            print("'tile' must be integer index or string identifier")
+            return None
+
+        if isinstance(round, int):
+            if round < 0:
+                print("Set round index >=0 and <" + str(self._num_rounds))
+                return None
+            else:
+                round_id = self._round_ids[round]
+        elif isinstance(round, str):
+            if round not in self._round_ids:
+                print("Set valid round id")
+                return None
+            else:
+                round_id = round
+        else:
+            print("'round' must be integer index or string identifier")
+            return None
+
+        rigid_xform_xyz_px = self._read_local_rigid_xform_xyz_px(tile_id, round_id)
+        if rigid_xform_xyz_px is None:
+            return None
+
+        of_xform = self._read_coord_of_xform_px(
+            tile_id, round_id, return_future, missing_ok=True
+        )
+        if of_xform is None:
+            return rigid_xform_xyz_px, None, None
+
+        return rigid_xform_xyz_px, *of_xform
+
     def load_local_registered_image(
         self,
         tile: Union[int, str],
@@ -3065,8 +3291,10 @@ class qi2labDataStore:
             return None
 
         try:
-            spec = self._zarrv2_spec.copy()
-            spec["metadata"]["dtype"] = "<u2"
+            spec = {
+                **self._zarrv2_spec,
+                "metadata": {**self._zarrv2_spec["metadata"], "dtype": "<u2"},
+            }
             registered_decon_image = self._load_from_zarr_array(
                 self._get_kvstore_key(current_local_zarr_path),
                 spec,
@@ -3103,6 +3331,11 @@ class qi2labDataStore:
             Bit index or bit id.
         return_future : Optional[bool]
             Return future array.
+
+        Returns
+        -------
+        write_future : Optional[ArrayLike]
+            Delayed (future) write if return_future is True.
         """
 
         if (round is None and bit is None) or (round is not None and bit is not None):
@@ -3183,9 +3416,11 @@ class qi2labDataStore:
             )
 
         try:
-            spec = self._zarrv2_spec.copy()
-            spec["metadata"]["dtype"] = "<u2"
-            self._save_to_zarr_array(
+            spec = {
+                **self._zarrv2_fast_spec,
+                "metadata": {**self._zarrv2_fast_spec["metadata"], "dtype": "<u2"},
+            }
+            write_future = self._save_to_zarr_array(
                 registered_image,
                 self._get_kvstore_key(current_local_zarr_path),
                 spec,
@@ -3194,6 +3429,7 @@ class qi2labDataStore:
             attributes = self._load_from_json(current_local_zattrs_path)
             attributes["deconvolution"] = deconvolution
             self._save_to_json(attributes, current_local_zattrs_path)
+            return write_future
         except (IOError, OSError, TimeoutError):
             print("Error saving corrected image.")
             return None
@@ -3264,8 +3500,10 @@ class qi2labDataStore:
             return None
 
         try:
-            spec = self._zarrv2_spec.copy()
-            spec["metadata"]["dtype"] = "<f4"
+            spec = {
+                **self._zarrv2_spec,
+                "metadata": {**self._zarrv2_spec["metadata"], "dtype": "<f4"},
+            }
             registered_ufish_image = self._load_from_zarr_array(
                 self._get_kvstore_key(current_local_zarr_path),
                 spec,
@@ -3296,6 +3534,11 @@ class qi2labDataStore:
             Bit index or bit id.
         return_future : Optional[bool]
             Return future array.
+
+        Returns
+        -------
+        write_future : Optional[ArrayLike]
+            Delayed (future) write if return_future is True.
         """
 
         if isinstance(tile, int):
@@ -3338,10 +3581,10 @@ class qi2labDataStore:
             )
 
         try:
-            self._save_to_zarr_array(
+            return self._save_to_zarr_array(
                 ufish_image,
                 self._get_kvstore_key(current_local_zarr_path),
-                self._zarrv2_spec.copy(),
+                self._zarrv2_fast_spec.copy(),
                 return_future,
             )
         except (IOError, OSError, ZarrError) as e:
@@ -3520,13 +3763,7 @@ class qi2labDataStore:
             return None
 
         try:
-            zattrs_path = str(
-                self._polyDT_root_path
-                / Path(tile_id)
-                / Path(self._round_ids[0] + ".zarr")
-                / Path(".zattrs")
-            )
-            attributes = self._load_from_json(zattrs_path)
+            attributes = self._load_round_attrs(tile_id, self._round_ids[0])
             affine_zyx_um = np.asarray(attributes["affine_zyx_um"], dtype=np.float32)
             origin_zyx_um = np.asarray(attributes["origin_zyx_um"], dtype=np.float32)
             spacing_zyx_um = np.asarray(attributes["spacing_zyx_um"], dtype=np.float32)
@@ -3777,9 +4014,15 @@ class qi2labDataStore:
 
     def load_global_filtered_decoded_spots(
         self,
+        columns: Optional[Sequence[str]] = None,
     ) -> Optional[pd.DataFrame]:
         """Load all decoded and filtered spots.
         
+        Parameters
+        ----------
+        columns : Optional[Sequence[str]], default None
+            Columns to load. If None, load all columns.
+        
         Returns
         -------
         all_tiles_filtered : Optional[pd.DataFrame]
@@ -3798,7 +4041,7 @@ class qi2labDataStore:
             return None
         else:
             all_tiles_filtered = self._load_from_parquet(
-                current_global_filtered_decoded_path
+                current_global_filtered_decoded_path, columns=columns
             )
             return all_tiles_filtered
 
@@ -4055,7 +4298,7 @@ class qi2labDataStore:
                     roi.coordinates = coords  # Explicitly assign coordinates to the ROI
                     roi.name = f"cell_{str(cell_id)}_zstart_{str(z_start)}_zend_{str(z_end)}"  # Ensure unique name
                     rois.append(roi)
-                except Exception as e:
+                except (TypeError, ValueError) as e:
                     print(f"Error while creating ROI for cell ID {cell_id}: {e}")
 
         # Write all ROIs to a ZIP file   
@@ -4114,89 +4357,123 @@ class qi2labDataStore:
             baysor_rois = roiread(current_baysor_outlines_path)
             return baysor_rois
         
-    @staticmethod
-    def _roi_to_shapely(roi):
-        return Polygon(roi.subpixel_coordinates[:, ::-1])
-        
-    def reprocess_and_save_filtered_spots_with_baysor_outlines(self):
+    def reprocess_and_save_filtered_spots_with_baysor_outlines(
+        self, batch_size: int = 1_000_000
+    ):
         """Reprocess filtered spots using baysor cell outlines, then save.
         
         Loads the 3D cell outlines from Baysor, checks all points to see what 
         (if any) cell outline that the spot falls within, and then saves the
-        data back to the datastore.
+        data back to the datastore. Spots are streamed through in row batches,
+        so peak memory does not grow with the number of spots.
+
+        Parameters
+        ----------
+        batch_size : int, default 1_000_000
+            Number of spots read, assigned, and written per batch.
         """
-        from rtree import index
-        import re
+        import pyarrow as pa
+        import pyarrow.parquet as pq
         
         rois = self.load_global_baysor_outlines()
-        filtered_spots_df = self.load_global_filtered_decoded_spots()
-        
-        parsed_spots_df = filtered_spots_df[
-                [
+
+        # Parse z range and cell name from each ROI name. There is one ROI
+        # per cell and z range, so bind the pattern and appends locally.
+        outlines = []
+        z_ranges = []
+        cell_names = []
+        search_z_range = re.compile(r"zstart_([-\d.]+)_zend_([-\d.]+)").search
+        append_outline = outlines.append
+        append_z_range = z_ranges.append
+        append_cell_name = cell_names.append
+        for roi in rois:
+            roi_name = roi.name
+            match = search_z_range(roi_name)
+            if match:
+                append_outline(roi.coordinates()[:, ::-1])
+                append_z_range((float(match.group(1)), float(match.group(2))))
+                append_cell_name(roi_name.split("_")[1])
+        z_ranges = np.asarray(z_ranges, dtype=np.float64).reshape(-1, 2)
+        cell_names = np.asarray(cell_names, dtype=object)
+        vertices, vertex_offsets, bboxes = polygons_to_arrays(outlines)
+
+        current_global_filtered_decoded_dir_path = self._datastore_path / Path(
+            "all_tiles_filtered_decoded_features"
+        )
+        current_global_filtered_decoded_path = (
+            current_global_filtered_decoded_dir_path / Path("decoded_features.parquet")
+        )
+        current_global_refined_path = (
+            current_global_filtered_decoded_dir_path / Path("refined_transcripts.parquet")
+        )
+
+        if not current_global_filtered_decoded_path.exists():
+            print("Global, filtered, decoded spots not found.")
+            return None
+
+        parquet_file = pq.ParquetFile(current_global_filtered_decoded_path)
+        writer = None
+        try:
+            for batch in parquet_file.iter_batches(
+                batch_size=batch_size,
+                columns=[
                     "gene_id",
                     "global_z",
                     "global_y",
                     "global_x",
                     "cell_id",
                     "tile_idx",
-                ]
-        ].copy()
-        parsed_spots_df.rename(
-            columns={
-                "global_x": "x",
-                "global_y": "y",
-                "global_z": "z",
-                "gene_id" : "gene",
-                "cell_id" : "cell",
-            },
-            inplace=True,
-        )
-        parsed_spots_df["transcript_id"] = pd.util.hash_pandas_object(
-            parsed_spots_df, index=False
-        )
-        
-        parsed_spots_df["assignment_confidence"] = 1.0
-        
-        # Create spatial index for ROIs
-        roi_index = index.Index()
-        roi_map = {}  # Map index IDs to ROIs
-
-        for idx, roi in enumerate(rois):
-            # Ensure roi.coordinates contains the polygon points
-            coords = roi.coordinates()
-
-            # Insert the polygon bounds into the spatial index
-            polygon = Polygon(coords)
-            roi_index.insert(idx, polygon.bounds)  # Use polygon bounds for indexing
-            roi_map[idx] = roi
-
-        # Function to check a single point
-        def point_in_roi(row):
-            point = Point(row["x"], row["y"])
-            candidate_indices = list(roi_index.intersection(point.bounds))  # Search spatial index
-            for idx in candidate_indices:
-                roi = roi_map[idx]
-                match = re.search(r"zstart_([-\d.]+)_zend_([-\d.]+)", roi.name)
-                if match:
-                    z_start = float(match.group(1))
-                    z_end = float(match.group(2))
-                    if z_start <= row["z"] <= z_end:
-                        polygon = Polygon(roi.coordinates())
-                        if polygon.contains(point):
-                            return str(roi.name.split("_")[1]) 
-            return -1
-
-        # Apply optimized spatial lookup
-        parsed_spots_df["cell"] = parsed_spots_df.apply(point_in_roi, axis=1)
-        parsed_spots_df = parsed_spots_df.loc[parsed_spots_df["cell"] != -1]
+                ],
+            ):
+                parsed_spots_df = batch.to_pandas()
+                parsed_spots_df.rename(
+                    columns={
+                        "global_x": "x",
+                        "global_y": "y",
+                        "global_z": "z",
+                        "gene_id" : "gene",
+                        "cell_id" : "cell",
+                    },
+                    inplace=True,
+                )
+                parsed_spots_df["transcript_id"] = pd.util.hash_pandas_object(
+                    parsed_spots_df, index=False
+                )
                 
-        current_global_filtered_decoded_path = (
-            self._datastore_path 
-            / Path("all_tiles_filtered_decoded_features")
-            / Path("refined_transcripts.parquet")
-        )
+                parsed_spots_df["assignment_confidence"] = 1.0
+
+                # Parallel point-in-polygon on raw coordinates
+                roi_id = assign_points_to_polygons(
+                    parsed_spots_df["y"].to_numpy(),
+                    parsed_spots_df["x"].to_numpy(),
+                    vertices,
+                    vertex_offsets,
+                    bboxes,
+                    zs=parsed_spots_df["z"].to_numpy(),
+                    z_ranges=z_ranges,
+                )
+                point_idx = np.flatnonzero(roi_id)
+                roi_idx = roi_id[point_idx] - 1
 
-        self._save_to_parquet(parsed_spots_df, current_global_filtered_decoded_path)
+                parsed_spots_df = parsed_spots_df.iloc[point_idx]
+                refined_table = pa.Table.from_pandas(
+                    parsed_spots_df, preserve_index=False
+                )
+                # explicit string type keeps the schema stable for empty batches
+                refined_table = refined_table.set_column(
+                    refined_table.schema.get_field_index("cell"),
+                    "cell",
+                    pa.array(cell_names[roi_idx], type=pa.string()),
+                )
+
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        current_global_refined_path, refined_table.schema
+                    )
+                writer.write_table(refined_table)
+        finally:
+            if writer is not None:
+                writer.close()
         
     def save_mtx(self, spots_source: str = ""):
         """Save mtx file for downstream analysis. Assumes Baysor has been run.
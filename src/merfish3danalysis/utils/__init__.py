@@ -2,5 +2,6 @@ from . import dataio
 from . import imageprocessing
 from . import opmtools
 from . import registration
+from . import spatial
 
-__all__ = ["dataio", "imageprocessing", "opmtools", "registration"]
\ No newline at end of file
+__all__ = ["dataio", "imageprocessing", "opmtools", "registration", "spatial"]
\ No newline at end of file
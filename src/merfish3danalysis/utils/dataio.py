@@ -111,8 +111,8 @@ def read_fluidics_program(program_path: Union[Path,str]) -> pd.DataFrame:
         df_fluidics["pump"] = df_fluidics["pump"].astype(int)
 
         print("Fluidics program loaded")
-    except Exception as e:
-        raise Exception("Error in loading fluidics file:\n", e)
+    except (OSError, KeyError, ValueError) as e:
+        raise Exception("Error in loading fluidics file:\n", e) from e
 
     return df_fluidics
 
@@ -220,23 +220,17 @@ def create_mtx(
     cells = transcripts_df["cell"].dropna().unique()
     cells = cells[cells != 0]
 
-    # Create a cells x features data frame, initialized with 0
-    matrix = pd.DataFrame(0, index=range(len(features)), columns=cells, dtype=np.int32)
-
-    # Iterate through all transcripts
-    for index, row in transcripts_df.iterrows():
-        feature = str(row['gene'])
-        cell = row['cell']
-        conf = row['assignment_confidence']
-
-        # Ignore transcript below user-specified cutoff
-        if conf < confidence_cutoff:
-            continue
-        
-        # If cell is not 0 at this point, it means the transcript is associated with a cell
-        if cell != 0:
-            # Increment count in feature-cell matrix
-            matrix.at[feature_to_index[feature], cell] += 1
+    # Count transcripts per feature-cell pair. Ignore transcripts below the
+    # user-specified cutoff and transcripts not associated with a cell (0).
+    counted_df = transcripts_df[
+        ~(transcripts_df["assignment_confidence"] < confidence_cutoff)
+        & (transcripts_df["cell"] != 0)
+    ]
+    feature_idx = counted_df["gene"].astype(str).map(feature_to_index).to_numpy()
+    cell_idx = pd.Index(cells).get_indexer(counted_df["cell"])
+    counts = np.zeros((len(features), len(cells)), dtype=np.int32)
+    np.add.at(counts, (feature_idx, cell_idx), 1)
+    matrix = pd.DataFrame(counts, index=range(len(features)), columns=cells)
 
     # Call a helper function to create Seurat and Scanpy compatible MTX output
     write_sparse_mtx(output_dir_path, matrix, cells, features)
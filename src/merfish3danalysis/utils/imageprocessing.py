@@ -16,7 +16,7 @@ import gc
 from numpy.typing import ArrayLike
 from numba import njit, prange
 from typing import Sequence, Tuple
-from pycudadecon import decon
+from pycudadecon import TemporaryOTF, RLContext, rl_decon
 from ryomen import Slicer
 import builtins
 from basicpy import BaSiC
@@ -69,7 +69,7 @@ def replace_hot_pixels(
         median = ndimage.median_filter(data[z_idx, :, :], size=3)
         data[z_idx, :] = inverted_hot_pixels * data[z_idx, :] + hot_pixels * median
 
-    data[data < 0] = 0
+    xp.maximum(data, 0, out=data)
 
     if CUPY_AVIALABLE:
         data = xp.asnumpy(data).astype(np.uint16)
@@ -141,14 +141,60 @@ def downsample_image_isotropic(image: ArrayLike, level: int = 2) -> ArrayLike:
         downsampled 3D image
     """
 
-    downsampled_image = downsample_axis(
-        downsample_axis(downsample_axis(image, level, 0), level, 1), level, 2
-    )
+    downsampled_image = downsample_blocks(image, level)
+
+    return downsampled_image
+
+
+@njit(parallel=True, cache=True)
+def downsample_blocks(image: ArrayLike, level: int = 2) -> ArrayLike:
+    """Numba accelerated block mean of a 3D image in a single pass.
+
+    Equivalent to calling downsample_axis along z, y, and x in turn, but
+    reads the input once with contiguous x access and accumulates in
+    float64 without intermediate images. Edge blocks average only the
+    voxels inside the image.
+
+    Parameters
+    ----------
+    image: ArrayLike
+        3D image to be downsampled.
+    level: int
+        Amount of downsampling along every axis.
+
+    Returns
+    -------
+    downsampled_image: ArrayLike
+        3D downsampled image.
+    """
+
+    size_z, size_y, size_x = image.shape
+    new_z = size_z // level + (1 if size_z % level != 0 else 0)
+    new_y = size_y // level + (1 if size_y % level != 0 else 0)
+    new_x = size_x // level + (1 if size_x % level != 0 else 0)
+    downsampled_image = np.zeros((new_z, new_y, new_x), dtype=image.dtype)
+
+    for z in prange(new_z):
+        z_start = z * level
+        z_stop = min(z_start + level, size_z)
+        row_sum = np.zeros(new_x, dtype=np.float64)
+        for y in range(new_y):
+            y_start = y * level
+            y_stop = min(y_start + level, size_y)
+            row_sum[:] = 0.0
+            for z_idx in range(z_start, z_stop):
+                for y_idx in range(y_start, y_stop):
+                    for x_idx in range(size_x):
+                        row_sum[x_idx // level] += image[z_idx, y_idx, x_idx]
+            block_count = (z_stop - z_start) * (y_stop - y_start)
+            for x in range(new_x):
+                x_count = min((x + 1) * level, size_x) - x * level
+                downsampled_image[z, y, x] = row_sum[x] / (block_count * x_count)
 
     return downsampled_image
 
 
-@njit(parallel=True)
+@njit(parallel=True, cache=True)
 def downsample_axis(
     image: ArrayLike, 
     level: int = 2, 
@@ -231,6 +277,48 @@ def downsample_axis(
     return downsampled_image
 
 
+@njit(parallel=True, cache=True)
+def sum_pixels_in_roi(
+    image: ArrayLike,
+    coords: ArrayLike,
+    roi_dims: Tuple[int, int, int] = (7, 5, 5),
+) -> ArrayLike:
+    """Numba accelerated sum of pixels in a box around each spot.
+
+    Parameters
+    ----------
+    image: ArrayLike
+        3D image
+    coords: ArrayLike
+        [n_spots, 3] spot coordinates in zyx pixels
+    roi_dims: Tuple[int, int, int], default (7, 5, 5)
+        box size in zyx pixels
+
+    Returns
+    -------
+    sums: ArrayLike
+        sum of pixels in the box around each spot
+    """
+
+    sums = np.zeros(coords.shape[0], dtype=np.float64)
+    for i in prange(coords.shape[0]):
+        z_min = max(0.0, coords[i, 0] - roi_dims[0] // 2)
+        y_min = max(0.0, coords[i, 1] - roi_dims[1] // 2)
+        x_min = max(0.0, coords[i, 2] - roi_dims[2] // 2)
+        z_max = min(image.shape[0], z_min + roi_dims[0])
+        y_max = min(image.shape[1], y_min + roi_dims[1])
+        x_max = min(image.shape[2], x_min + roi_dims[2])
+
+        total = 0.0
+        for z in range(int(z_min), int(z_max)):
+            for y in range(int(y_min), int(y_max)):
+                for x in range(int(x_min), int(x_max)):
+                    total += image[z, y, x]
+        sums[i] = total
+
+    return sums
+
+
 def next_multiple_of_32(x: int) -> int:
     """Calculate next multiple of 32 for the given integer.
 
@@ -360,37 +448,54 @@ def chunked_cudadecon(
 
     image_decon_padded = np.zeros_like(image_padded)
 
+    crop_size = (image_padded.shape[0], 1600, 1600)
     slices = Slicer(
         image_padded,
-        crop_size=(image_padded.shape[0], 1600, 1600),
+        crop_size=crop_size,
         overlap=(0, 32, 32),
         batch_size=1,
         pad=True,
     )
 
-    for crop, source, destination in slices:
-        builtins.print= no_op
-        image_decon_padded[destination] = decon(
-            images=crop,
-            psf=psf,
+    # every crop has the same shape, so the OTF and the RL context (cuFFT
+    # plans and GPU buffers) are built once and reused for all crops
+    crop_shape = tuple(
+        min(image_dim, crop_dim)
+        for image_dim, crop_dim in zip(image_padded.shape, crop_size)
+    )
+    builtins.print = no_op
+    try:
+        with TemporaryOTF(
+            psf,
             dzpsf=float(psf_voxel_zyx_um[0]),
             dxpsf=float(psf_voxel_zyx_um[1]),
-            dzdata=float(image_voxel_zyx_um[0]),
-            dxdata=float(image_voxel_zyx_um[1]),
             wavelength=int(wavelength_um * 1000),
             na=float(na),
             nimm=float(ri),
-            n_iters=int(n_iters),
             cleanup_otf=True,
-            napodize=15,
-            background=float(background),
-        )[source]
+        ) as otf:
+            with RLContext(
+                crop_shape,
+                otf.path,
+                dzdata=float(image_voxel_zyx_um[0]),
+                dxdata=float(image_voxel_zyx_um[1]),
+                dzpsf=float(psf_voxel_zyx_um[0]),
+                dxpsf=float(psf_voxel_zyx_um[1]),
+            ) as ctx:
+                for crop, source, destination in slices:
+                    image_decon_padded[destination] = rl_decon(
+                        crop,
+                        output_shape=ctx.out_shape,
+                        background=float(background),
+                        n_iters=int(n_iters),
+                        napodize=15,
+                    )[source]
+    finally:
         builtins.print = original_print
 
     image_decon = remove_padding_z(image_decon_padded, pad_z_before, pad_z_after)
 
     del image_padded, image_decon_padded
-    gc.collect()
 
     return image_decon
 
@@ -24,7 +24,7 @@ from numba import njit, prange
 import gc
 
 
-@njit
+@njit(cache=True)
 def deskew_shape_estimator(
     input_shape: Sequence[int],
     theta: float = 30.0,
@@ -68,7 +68,7 @@ def deskew_shape_estimator(
     return [final_nz, final_ny, final_nx]
 
 
-@njit(parallel=True)
+@njit(parallel=True, cache=True)
 def deskew(
     data: ArrayLike,
     theta: float = 30.0,
@@ -331,8 +331,8 @@ def chunked_orthogonal_deskew(
         raw_data = np.array(oblique_image[scan_px_start:scan_px_stop, :]).astype(
             np.float32
         )
-        raw_data = raw_data - camera_bkd
-        raw_data[raw_data < 0.0] = 0.0
+        raw_data -= camera_bkd
+        np.maximum(raw_data, 0.0, out=raw_data)
         raw_data = ((raw_data * camera_cf) / camera_qe).astype(np.uint16)
 
         if perform_decon:
@@ -18,11 +18,12 @@ import numpy as np
 from numpy.typing import ArrayLike
 from typing import Union, Sequence, Tuple, Optional
 import SimpleITK as sitk
+from scipy.fft import next_fast_len
 import deeds
-import gc
 
 try:
     import cupy as cp # type: ignore
+    from cupyx.scipy import ndimage # type: ignore
     xp = cp
     CUPY_AVAILABLE = True
 except ImportError:
@@ -102,9 +103,199 @@ def apply_transform(image1: ArrayLike,
     resampled_image = resampler.Execute(image2_sitk)
     
     del image1_sitk, image2_sitk
-    gc.collect()
 
-    return sitk.GetArrayFromImage(resampled_image).astype(np.float32)
+    return sitk.GetArrayFromImage(resampled_image).astype(np.float32, copy=False)
+
+def translate_image(image: ArrayLike,
+                    shift_xyz: Sequence[float]) -> ArrayLike:
+    """
+    Translate image without the simpleITK resampler.
+
+    Matches apply_transform with a sitk.TranslationTransform, i.e. output
+    voxel p samples the input at p + shift_xyz. Whole-voxel shifts are a
+    strided copy, sub-voxel shifts use linear interpolation on the GPU.
+    Falls back to apply_transform if cupy is not available.
+
+    Parameters
+    ----------
+    image: ArrayLike
+        image to translate
+    shift_xyz: Sequence[float]
+        translation in xyz order, as passed to sitk.TranslationTransform
+
+    Returns
+    -------
+    translated_image: ArrayLike
+        translated image, zero outside the input
+    """
+
+    shift_zyx = [-float(i) for i in shift_xyz[::-1]]
+
+    if all(i.is_integer() for i in shift_zyx):
+        translated_image = np.zeros(image.shape, dtype=np.float32)
+        destination = []
+        source = []
+        for shift, size in zip(shift_zyx, image.shape):
+            shift = int(np.clip(shift, -size, size))
+            destination.append(slice(max(shift, 0), size + min(shift, 0)))
+            source.append(slice(max(-shift, 0), size - max(shift, 0)))
+        translated_image[tuple(destination)] = image[tuple(source)]
+        return translated_image
+
+    if not CUPY_AVAILABLE:
+        return apply_transform(image, image, sitk.TranslationTransform(3, shift_xyz))
+
+    # clamp neighbors at the border and zero samples more than half a voxel
+    # outside the input, same as the sitk linear interpolator
+    image = cp.asarray(image, dtype=cp.float32)
+    translated_image = ndimage.shift(image, shift_zyx, order=1, mode="nearest")
+    for axis, (shift, size) in enumerate(zip(shift_zyx, image.shape)):
+        start = min(max(int(np.ceil(shift - 0.5)), 0), size)
+        stop = min(max(int(np.ceil(size - 0.5 + shift)), 0), size)
+        translated_image[(slice(None),) * axis + (slice(0, start),)] = 0
+        translated_image[(slice(None),) * axis + (slice(stop, None),)] = 0
+
+    translated_image = cp.asnumpy(translated_image)
+    del image
+    cp.get_default_memory_pool().free_all_blocks()
+
+    return translated_image
+
+def warp_with_optical_flow(image: ArrayLike,
+                           of_xform_px: ArrayLike,
+                           shift_xyz: Optional[Sequence[float]] = None) -> ArrayLike:
+    """
+    Warp image with an optical flow field.
+
+    Reproduces the simpleITK path: resample the field onto the image grid,
+    wrap it in a sitk.DisplacementFieldTransform, and linearly resample the
+    image. The field and image share unit spacing there, so the field lands
+    on the image grid at the same voxel indices and is zero beyond its
+    extent. Runs on the GPU with map_coordinates when cupy is available.
+
+    If shift_xyz is given, the image is first translated as in
+    translate_image. On the GPU the translation is folded into the sample
+    coordinates, so both steps take a single interpolation pass.
+
+    Parameters
+    ----------
+    image: ArrayLike
+        image to warp
+    of_xform_px: ArrayLike
+        [3, z, y, x] optical flow field, displacement in (x, y, z) order
+    shift_xyz: Optional[Sequence[float]], default None
+        rigid translation in xyz order applied before the field
+
+    Returns
+    -------
+    warped_image: ArrayLike
+        warped image
+    """
+
+    if not CUPY_AVAILABLE:
+        if shift_xyz is not None:
+            image = translate_image(image, shift_xyz)
+        image_sitk = sitk.GetImageFromArray(image)
+        of_xform_sitk = sitk.GetImageFromArray(
+            np.asarray(of_xform_px).transpose(1, 2, 3, 0).astype(np.float32),
+            isVector=True,
+        )
+        optical_flow_sitk = sitk.Resample(
+            of_xform_sitk,
+            image_sitk,
+            sitk.Transform(3, sitk.sitkIdentity),
+            sitk.sitkLinear,
+            0,
+            sitk.sitkVectorFloat64,
+        )
+        displacement_field = sitk.DisplacementFieldTransform(optical_flow_sitk)
+        del of_xform_sitk, optical_flow_sitk
+        warped_image_sitk = sitk.Resample(image_sitk, displacement_field)
+        del image_sitk, displacement_field
+
+        return sitk.GetArrayFromImage(warped_image_sitk).astype(np.float32, copy=False)
+
+    image = cp.asarray(image, dtype=cp.float32)
+    field_shape = [min(i, j) for i, j in zip(of_xform_px.shape[1:], image.shape)]
+    of_xform_px = cp.asarray(
+        of_xform_px[:, : field_shape[0], : field_shape[1], : field_shape[2]],
+        dtype=cp.float32,
+    )
+
+    # warp in z slabs to bound the size of the coordinate array
+    warped_image = np.empty(image.shape, dtype=np.float32)
+    z_step = max(1, 2**24 // (image.shape[1] * image.shape[2]))
+    for z_start in range(0, image.shape[0], z_step):
+        z_stop = min(z_start + z_step, image.shape[0])
+        coords = cp.stack(
+            cp.meshgrid(
+                cp.arange(z_start, z_stop, dtype=cp.float32),
+                cp.arange(image.shape[1], dtype=cp.float32),
+                cp.arange(image.shape[2], dtype=cp.float32),
+                indexing="ij",
+            )
+        )
+        field_z_stop = min(z_stop, field_shape[0])
+        if z_start < field_z_stop:
+            for axis in range(3):
+                coords[
+                    axis, : field_z_stop - z_start, : field_shape[1], : field_shape[2]
+                ] += of_xform_px[2 - axis, z_start:field_z_stop]
+
+        # clamp neighbors at the border and zero samples more than half a
+        # voxel outside the input, same as the sitk linear interpolator.
+        # With a rigid shift the translated image is also zero outside the
+        # grid, so samples are checked before and after the shift.
+        outside = cp.zeros(coords.shape[1:], dtype=bool)
+        for axis in range(3):
+            outside |= (coords[axis] < -0.5) | (
+                coords[axis] >= image.shape[axis] - 0.5
+            )
+        if shift_xyz is not None:
+            for axis in range(3):
+                coords[axis] += float(shift_xyz[2 - axis])
+                outside |= (coords[axis] < -0.5) | (
+                    coords[axis] >= image.shape[axis] - 0.5
+                )
+        warped_slab = ndimage.map_coordinates(image, coords, order=1, mode="nearest")
+        warped_slab[outside] = 0
+        del outside
+        warped_image[z_start:z_stop] = cp.asnumpy(warped_slab)
+        del coords, warped_slab
+
+    del image, of_xform_px
+    cp.get_default_memory_pool().free_all_blocks()
+
+    return warped_image
+
+def pad_to_fast_shape(image: ArrayLike) -> ArrayLike:
+    """
+    Zero pad the trailing edge of each axis to a fast FFT length.
+
+    Parameters
+    ----------
+    image: ArrayLike
+        image to pad
+
+    Returns
+    -------
+    padded_image: ArrayLike
+        zero padded image. Returned unchanged if already a fast shape.
+    """
+
+    # real=True keeps to 2, 3, 5-smooth lengths, which suit cuFFT on the
+    # cucim path. The default also allows 7 and 11 factors.
+    pad_width = [
+        (0, next_fast_len(int(dim), real=True) - int(dim)) for dim in image.shape
+    ]
+    if all(after == 0 for _, after in pad_width):
+        return image
+
+    if CUPY_AVAILABLE:
+        array_module = cp.get_array_module(image)
+    else:
+        array_module = np
+    return array_module.pad(image, pad_width)
 
 def compute_rigid_transform(image1: ArrayLike, 
                             image2: ArrayLike,
@@ -145,32 +336,31 @@ def compute_rigid_transform(image1: ArrayLike,
             image2 = np.squeeze(np.max(image2,axis=1))
                 
     if projection == 'search':
+        # cast the reference slice and compute its range once, and keep the
+        # per-slice scores on the device until the final argmax
         if CUPY_AVAILABLE and CUCIM_AVAILABLE:
             image1_cp = cp.asarray(image1)
             ref_slice_idx = image1_cp.shape[0]//2
             ref_slice = image1_cp[ref_slice_idx,:,:]
-            image2_cp = cp.asarray(image2)
-            ssim = []
-            for z_idx in range(image1.shape[0]):
-                ssim_slice = structural_similarity(ref_slice.astype(cp.uint16),
-                                                   image2_cp[z_idx,:].astype(cp.uint16),
-                                                   data_range=cp.max(ref_slice)-cp.min(ref_slice))
-                ssim.append(cp.asnumpy(ssim_slice))
-            
-            ssim = np.array(ssim)
-            found_shift = float(ref_slice_idx - np.argmax(ssim))
-            del image1_cp, image2_cp, ssim_slice, ssim
+            data_range = cp.max(ref_slice)-cp.min(ref_slice)
+            ref_slice = ref_slice.astype(cp.uint16)
+            image2_cp = cp.asarray(image2).astype(cp.uint16)
+            ssim = cp.stack([structural_similarity(ref_slice,
+                                                   image2_cp[z_idx,:],
+                                                   data_range=data_range)
+                             for z_idx in range(image1.shape[0])])
+            found_shift = float(ref_slice_idx - int(cp.argmax(ssim)))
+            del image1_cp, image2_cp, ref_slice, ssim
         else:
             ref_slice_idx = image1.shape[0]//2
             ref_slice = image1[ref_slice_idx,:,:]
-            ssim = []
-            for z_idx in range(image1.shape[0]):
-                ssim_slice = structural_similarity(ref_slice.astype(np.uint16),
-                                                   image2[z_idx,:].astype(np.uint16),
-                                                   data_range=np.max(ref_slice)-np.min(ref_slice))
-                ssim.append(ssim_slice)
-            
-            ssim = np.array(ssim)
+            data_range = np.max(ref_slice)-np.min(ref_slice)
+            ref_slice = ref_slice.astype(np.uint16)
+            image2_u16 = np.asarray(image2).astype(np.uint16)
+            ssim = np.array([structural_similarity(ref_slice,
+                                                   image2_u16[z_idx,:],
+                                                   data_range=data_range)
+                             for z_idx in range(image1.shape[0])])
             found_shift = float(ref_slice_idx - np.argmax(ssim))
 
     else:
@@ -191,8 +381,11 @@ def compute_rigid_transform(image1: ArrayLike,
                                                         reference_mask=mask,
                                                         disambiguate=True)
             else:
-                shift_cp, _, _ = phase_cross_correlation(reference_image=cp.asarray(image1), 
-                                                        moving_image=cp.asarray(image2),
+                # zero pad the trailing edges to fast FFT sizes. The pad is a
+                # few voxels, so the correlation stays nearly circular and the
+                # shift estimate matches the unpadded one.
+                shift_cp, _, _ = phase_cross_correlation(reference_image=pad_to_fast_shape(cp.asarray(image1)), 
+                                                        moving_image=pad_to_fast_shape(cp.asarray(image2)),
                                                         upsample_factor=10,
                                                         disambiguate=True)
             shift = cp.asnumpy(shift_cp)
@@ -213,8 +406,11 @@ def compute_rigid_transform(image1: ArrayLike,
                                                         reference_mask=mask,
                                                         disambiguate=True)
             else:
-                shift , _, _ = phase_cross_correlation(reference_image=image1, 
-                                                        moving_image=image2,
+                # zero pad the trailing edges to fast FFT sizes. The pad is a
+                # few voxels, so the correlation stays nearly circular and the
+                # shift estimate matches the unpadded one.
+                shift , _, _ = phase_cross_correlation(reference_image=pad_to_fast_shape(image1), 
+                                                        moving_image=pad_to_fast_shape(image2),
                                                         upsample_factor=10,
                                                         disambiguate=True)
     
@@ -239,7 +435,6 @@ def compute_rigid_transform(image1: ArrayLike,
     # Create an affine transform with the shift from the cross-correlation
     transform = sitk.TranslationTransform(3, shift_xyz)
     
-    gc.collect()
     cp.get_default_memory_pool().free_all_blocks()
 
     return transform, shift_xyz
@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+imageprocessing = pytest.importorskip("merfish3danalysis.utils.imageprocessing")
+
+
+@pytest.fixture
+def mock_image_data():
+    rng = np.random.default_rng(0)
+    return rng.uniform(0, 1000, size=(17, 63, 70)).astype(np.float32)
+
+
+@pytest.fixture
+def mock_spots(mock_image_data):
+    rng = np.random.default_rng(1)
+    n_spots = 500
+    # include spots at and past the image edges so the box is clipped
+    return pd.DataFrame(
+        {
+            "z": rng.uniform(-1, mock_image_data.shape[0] + 1, n_spots),
+            "y": rng.uniform(-2, mock_image_data.shape[1] + 2, n_spots),
+            "x": rng.uniform(-2, mock_image_data.shape[2] + 2, n_spots),
+        }
+    )
+
+
+@pytest.mark.parametrize("shape", [(16, 64, 64), (17, 63, 70), (5, 9, 3)])
+@pytest.mark.parametrize("level", [2, 3, 4])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_downsample_blocks(shape, level, dtype):
+    rng = np.random.default_rng(2)
+    image = rng.uniform(0, 1000, size=shape).astype(dtype)
+
+    expected = imageprocessing.downsample_axis(
+        imageprocessing.downsample_axis(
+            imageprocessing.downsample_axis(image, level, 0), level, 1
+        ),
+        level,
+        2,
+    )
+    downsampled_image = imageprocessing.downsample_blocks(image, level)
+
+    assert downsampled_image.shape == expected.shape
+    assert downsampled_image.dtype == image.dtype
+    np.testing.assert_allclose(downsampled_image, expected, rtol=1e-5)
+    np.testing.assert_array_equal(
+        imageprocessing.downsample_image_isotropic(image, level), downsampled_image
+    )
+
+
+def pandas_sum_pixels_in_roi(row, image, roi_dims):
+    z, y, x = row["z"], row["y"], row["x"]
+    roi_z, roi_y, roi_x = roi_dims
+    z_min, y_min, x_min = (
+        max(0, z - roi_z // 2),
+        max(0, y - roi_y // 2),
+        max(0, x - roi_x // 2),
+    )
+    z_max, y_max, x_max = (
+        min(image.shape[0], z_min + roi_z),
+        min(image.shape[1], y_min + roi_y),
+        min(image.shape[2], x_min + roi_x),
+    )
+    roi = image[
+        int(z_min) : int(z_max),
+        int(y_min) : int(y_max),
+        int(x_min) : int(x_max),
+    ]
+    return np.sum(roi)
+
+
+@pytest.mark.parametrize("roi_dims", [(7, 5, 5), (3, 3, 3), (1, 1, 1)])
+def test_sum_pixels_in_roi(mock_image_data, mock_spots, roi_dims):
+    expected = mock_spots.apply(
+        pandas_sum_pixels_in_roi,
+        axis=1,
+        image=mock_image_data,
+        roi_dims=roi_dims,
+    ).to_numpy()
+
+    sums = imageprocessing.sum_pixels_in_roi(
+        mock_image_data,
+        mock_spots[["z", "y", "x"]].to_numpy(),
+        roi_dims,
+    )
+
+    np.testing.assert_allclose(sums, expected, rtol=1e-5)
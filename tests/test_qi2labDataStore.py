@@ -0,0 +1,114 @@
+import pytest
+import numpy as np
+
+datastore_module = pytest.importorskip("merfish3danalysis.qi2labDataStore")
+
+
+@pytest.fixture
+def mock_datastore(tmp_path):
+    datastore = datastore_module.qi2labDataStore(tmp_path / "qi2labdatastore")
+    datastore.channels_in_data = ["alexa488", "atto565", "alexa647"]
+    datastore.experiment_order = np.array([[1, 1, 2], [2, 3, 4]])
+    datastore.num_tiles = 1
+    datastore.initialize_tile(0)
+    return datastore
+
+
+@pytest.fixture
+def mock_of_xform_px():
+    rng = np.random.default_rng(0)
+    of_xform_px = rng.normal(0, 1, size=(3, 8, 16, 16)).astype(np.float32)
+    # different flow magnitudes per axis, so each axis gets its own scale
+    of_xform_px *= np.array([0.5, 3.0, 7.5], dtype=np.float32).reshape(-1, 1, 1, 1)
+    return of_xform_px
+
+
+def test_of_xform_px_round_trip(mock_datastore, mock_of_xform_px):
+    mock_datastore.save_coord_of_xform_px(
+        mock_of_xform_px, tile=0, downsampling=[3.0, 3.0, 3.0], round=1
+    )
+
+    of_xform_px, downsampling = mock_datastore.load_coord_of_xform_px(
+        tile=0, round=1, return_future=False
+    )
+
+    assert of_xform_px.dtype == np.float32
+    assert of_xform_px.shape == mock_of_xform_px.shape
+    np.testing.assert_array_equal(downsampling, [3.0, 3.0, 3.0])
+    # int16 quantization error is at most half a step of max|flow| / 32000
+    max_abs = np.abs(mock_of_xform_px).reshape(3, -1).max(axis=1)
+    for axis in range(3):
+        np.testing.assert_allclose(
+            of_xform_px[axis],
+            mock_of_xform_px[axis],
+            rtol=0,
+            atol=0.5 * max_abs[axis] / 32000 * 1.01,
+        )
+
+
+def test_of_xform_px_round_trip_zero_flow(mock_datastore):
+    zero_of_xform_px = np.zeros((3, 8, 16, 16), dtype=np.float32)
+    mock_datastore.save_coord_of_xform_px(
+        zero_of_xform_px, tile=0, downsampling=[3.0, 3.0, 3.0], round=1
+    )
+
+    attributes = mock_datastore._load_round_attrs(
+        mock_datastore.tile_ids[0], mock_datastore.round_ids[1]
+    )
+    assert attributes["opticalflow_scale"] == [1.0, 1.0, 1.0]
+
+    of_xform_px, _ = mock_datastore.load_coord_of_xform_px(
+        tile=0, round=1, return_future=False
+    )
+
+    assert of_xform_px.dtype == np.float32
+    np.testing.assert_array_equal(of_xform_px, zero_of_xform_px)
+
+
+def test_of_xform_px_overwrite(mock_datastore, mock_of_xform_px):
+    mock_datastore.save_coord_of_xform_px(
+        mock_of_xform_px, tile=0, downsampling=[3.0, 3.0, 3.0], round=1
+    )
+    mock_datastore.save_coord_of_xform_px(
+        2 * mock_of_xform_px, tile=0, downsampling=[2.0, 2.0, 2.0], round=1
+    )
+
+    of_xform_px, downsampling = mock_datastore.load_coord_of_xform_px(
+        tile=0, round=1, return_future=False
+    )
+
+    np.testing.assert_array_equal(downsampling, [2.0, 2.0, 2.0])
+    max_abs = 2 * np.abs(mock_of_xform_px).max()
+    np.testing.assert_allclose(
+        of_xform_px, 2 * mock_of_xform_px, rtol=0, atol=max_abs / 32000
+    )
+
+
+def test_load_local_registration_xforms(mock_datastore, mock_of_xform_px, capsys):
+    mock_datastore.save_local_rigid_xform_xyz_px(
+        rigid_xform_xyz_px=np.array([1.5, -2.0, 0.25]), tile=0, round=1
+    )
+
+    # optical flow not run yet, so only the rigid shift is returned
+    rigid_xform_xyz_px, of_xform_px, downsampling = (
+        mock_datastore.load_local_registration_xforms(tile=0, round=1)
+    )
+    np.testing.assert_array_equal(rigid_xform_xyz_px, [1.5, -2.0, 0.25])
+    assert of_xform_px is None
+    assert downsampling is None
+    assert capsys.readouterr().out == ""
+
+    mock_datastore.save_coord_of_xform_px(
+        mock_of_xform_px, tile=0, downsampling=[3.0, 3.0, 3.0], round=1
+    )
+    rigid_xform_xyz_px, of_xform_px, downsampling = (
+        mock_datastore.load_local_registration_xforms(
+            tile=0, round=1, return_future=False
+        )
+    )
+    expected_of_xform_px, expected_downsampling = (
+        mock_datastore.load_coord_of_xform_px(tile=0, round=1, return_future=False)
+    )
+    np.testing.assert_array_equal(rigid_xform_xyz_px, [1.5, -2.0, 0.25])
+    np.testing.assert_array_equal(of_xform_px, expected_of_xform_px)
+    np.testing.assert_array_equal(downsampling, expected_downsampling)
@@ -0,0 +1,140 @@
+import types
+import pytest
+import numpy as np
+from scipy import ndimage as scipy_ndimage
+from scipy.ndimage import gaussian_filter
+
+registration = pytest.importorskip("merfish3danalysis.utils.registration")
+sitk = pytest.importorskip("SimpleITK")
+
+
+@pytest.fixture
+def mock_image_data():
+    rng = np.random.default_rng(0)
+    return rng.uniform(0, 1000, size=(12, 40, 45)).astype(np.float32)
+
+
+@pytest.mark.parametrize(
+    "shift_xyz",
+    [
+        [0.0, 0.0, 0.0],
+        [3.0, -5.0, 2.0],
+        [-7.0, 11.0, -1.0],
+        [60.0, 0.0, 0.0],
+        [1.25, -0.5, 0.75],
+        [-3.6, 2.3, -0.4],
+        [0.5, 0.5, 0.5],
+    ],
+)
+def test_translate_image(mock_image_data, shift_xyz):
+    expected = registration.apply_transform(
+        mock_image_data,
+        mock_image_data,
+        sitk.TranslationTransform(3, shift_xyz),
+    )
+
+    translated_image = registration.translate_image(mock_image_data, shift_xyz)
+
+    assert translated_image.shape == mock_image_data.shape
+    assert translated_image.dtype == np.float32
+    np.testing.assert_allclose(translated_image, expected, rtol=1e-5, atol=1e-2)
+
+
+@pytest.fixture
+def mock_smooth_image_data():
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(rng.uniform(0, 1000, size=(20, 48, 48)), 2)
+    image = 500 * (image - image.min()) / (image.max() - image.min())
+    return image.astype(np.float32)
+
+
+@pytest.fixture
+def mock_of_xform_px():
+    rng = np.random.default_rng(1)
+    of_xform_px = gaussian_filter(rng.normal(0, 1, size=(3, 20, 48, 48)), (0, 3, 3, 3))
+    return (1.5 * of_xform_px / np.abs(of_xform_px).max()).astype(np.float32)
+
+
+@pytest.fixture
+def fused_warp(monkeypatch):
+    """warp_with_optical_flow on the fused GPU branch.
+
+    Without cupy, numpy and scipy.ndimage stand in for cupy and
+    cupyx.scipy.ndimage, so the branch logic is still exercised.
+    """
+
+    if not registration.CUPY_AVAILABLE:
+        cp_standin = types.SimpleNamespace(
+            asarray=lambda array, dtype=None: np.asarray(array, dtype=dtype),
+            asnumpy=np.asarray,
+            float32=np.float32,
+            stack=np.stack,
+            meshgrid=np.meshgrid,
+            arange=np.arange,
+            zeros=np.zeros,
+            get_default_memory_pool=lambda: types.SimpleNamespace(
+                free_all_blocks=lambda: None
+            ),
+        )
+        monkeypatch.setattr(registration, "cp", cp_standin, raising=False)
+        monkeypatch.setattr(registration, "ndimage", scipy_ndimage, raising=False)
+        monkeypatch.setattr(registration, "CUPY_AVAILABLE", True)
+
+    return registration.warp_with_optical_flow
+
+
+def two_step_warp(image, of_xform_px, shift_xyz, monkeypatch):
+    """Translate then warp on the CPU with SimpleITK."""
+    with monkeypatch.context() as m:
+        m.setattr(registration, "CUPY_AVAILABLE", False)
+        translated_image = registration.translate_image(image, shift_xyz)
+        return registration.warp_with_optical_flow(translated_image, of_xform_px)
+
+
+@pytest.mark.parametrize(
+    "shift_xyz",
+    [[0.0, 0.0, 0.0], [2.0, -3.0, 1.0], [-1.0, 4.0, -2.0]],
+)
+def test_warp_with_optical_flow_integer_shift(
+    mock_smooth_image_data, mock_of_xform_px, fused_warp, shift_xyz, monkeypatch
+):
+    expected = two_step_warp(
+        mock_smooth_image_data, mock_of_xform_px, shift_xyz, monkeypatch
+    )
+
+    warped_image = fused_warp(
+        mock_smooth_image_data, mock_of_xform_px, shift_xyz=shift_xyz
+    )
+
+    # identical away from the half-voxel band at the translated border
+    margin = 6
+    interior = (slice(margin, -margin),) * 3
+    assert warped_image.dtype == np.float32
+    np.testing.assert_allclose(
+        warped_image[interior], expected[interior], rtol=0, atol=1e-3
+    )
+
+
+@pytest.mark.parametrize(
+    "shift_xyz",
+    [[1.5, -0.25, 0.5], [-2.7, 1.3, 0.6]],
+)
+def test_warp_with_optical_flow_subvoxel_shift(
+    mock_smooth_image_data, mock_of_xform_px, fused_warp, shift_xyz, monkeypatch
+):
+    expected = two_step_warp(
+        mock_smooth_image_data, mock_of_xform_px, shift_xyz, monkeypatch
+    )
+
+    warped_image = fused_warp(
+        mock_smooth_image_data, mock_of_xform_px, shift_xyz=shift_xyz
+    )
+
+    # the two-step path interpolates twice, the fused path once, so they
+    # differ by the extra smoothing of the intermediate resample
+    margin = 6
+    interior = (slice(margin, -margin),) * 3
+    difference = np.abs(warped_image[interior] - expected[interior])
+    value_range = float(np.ptp(mock_smooth_image_data))
+    assert difference.mean() < 0.01 * value_range
+    assert difference.max() < 0.05 * value_range
@@ -0,0 +1,177 @@
+import pytest
+import numpy as np
+
+spatial = pytest.importorskip("merfish3danalysis.utils.spatial")
+shapely = pytest.importorskip("shapely")
+from shapely.geometry import Polygon
+
+
+@pytest.fixture
+def mock_polygons():
+    rng = np.random.default_rng(42)
+    polygons = []
+    for center in rng.uniform(20, 180, size=(25, 2)):
+        n_vertices = int(rng.integers(5, 12))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        radii = rng.uniform(4, 15, n_vertices)
+        polygons.append(
+            np.stack(
+                [center[0] + radii * np.sin(angles), center[1] + radii * np.cos(angles)],
+                axis=1,
+            )
+        )
+    return polygons
+
+
+@pytest.fixture
+def mock_points():
+    rng = np.random.default_rng(7)
+    return rng.uniform(0, 200, size=(5000, 2))
+
+
+def brute_force_assign(polygons, ys, xs, zs=None, z_ranges=None):
+    """Lowest containing polygon index + 1, 0 if not in any polygon."""
+    polygon_id = np.zeros(len(ys), dtype=np.int32)
+    for k in range(len(polygons) - 1, -1, -1):
+        polygon = polygons[k]
+        if not isinstance(polygon, Polygon):
+            polygon = Polygon(np.asarray(polygon)[:, ::-1])
+        inside = shapely.contains_xy(polygon, xs, ys)
+        if z_ranges is not None:
+            inside &= (zs >= z_ranges[k, 0]) & (zs <= z_ranges[k, 1])
+        polygon_id[inside] = k + 1
+    return polygon_id
+
+
+def test_polygons_to_arrays(mock_polygons):
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays(mock_polygons)
+
+    assert vertices.shape == (2, sum(len(p) + 1 for p in mock_polygons))
+    assert vertex_offsets[0] == 0
+    assert vertex_offsets[-1] == vertices.shape[1]
+    for k, polygon in enumerate(mock_polygons):
+        ring = vertices[:, vertex_offsets[k] : vertex_offsets[k + 1]]
+        np.testing.assert_array_equal(ring[:, :-1], polygon.T)
+        np.testing.assert_array_equal(ring[:, -1], polygon[0])
+        assert np.all(bboxes[k, :2] <= polygon.min(axis=0))
+        assert np.all(bboxes[k, 2:] >= polygon.max(axis=0))
+
+
+def test_assign_points_to_polygons(mock_polygons, mock_points):
+    ys, xs = mock_points[:, 0], mock_points[:, 1]
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays(mock_polygons)
+
+    polygon_id = spatial.assign_points_to_polygons(
+        ys, xs, vertices, vertex_offsets, bboxes
+    )
+
+    np.testing.assert_array_equal(
+        polygon_id, brute_force_assign(mock_polygons, ys, xs)
+    )
+    assert np.any(polygon_id > 0)
+
+
+def test_assign_points_to_polygons_z_ranges(mock_polygons, mock_points):
+    rng = np.random.default_rng(3)
+    ys, xs = mock_points[:, 0], mock_points[:, 1]
+    zs = rng.uniform(0, 30, len(ys))
+    z_min = rng.uniform(0, 20, len(mock_polygons))
+    z_ranges = np.stack([z_min, z_min + 10], axis=1)
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays(mock_polygons)
+
+    polygon_id = spatial.assign_points_to_polygons(
+        ys, xs, vertices, vertex_offsets, bboxes, zs=zs, z_ranges=z_ranges
+    )
+
+    np.testing.assert_array_equal(
+        polygon_id, brute_force_assign(mock_polygons, ys, xs, zs, z_ranges)
+    )
+
+
+def test_assign_points_to_polygon_with_hole():
+    # a hole is drawn as a keyhole ring: outer ring, a slit in to the inner
+    # ring, the inner ring in reverse, and back out along the slit
+    outer = np.array([[0.0, 0.0], [0.0, 10.0], [10.0, 10.0], [10.0, 0.0]])
+    inner = np.array([[3.0, 3.0], [3.0, 7.0], [7.0, 7.0], [7.0, 3.0]])
+    keyhole = np.array(
+        [
+            [0.0, 0.0], [0.0, 10.0], [10.0, 10.0], [10.0, 0.0], [3.0, 0.0],
+            [3.0, 3.0], [7.0, 3.0], [7.0, 7.0], [3.0, 7.0], [3.0, 3.0], [3.0, 0.0],
+        ]
+    )
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays([keyhole])
+
+    rng = np.random.default_rng(11)
+    points = rng.uniform(-2, 12, size=(5000, 2))
+    # keep off the zero-width slit, where the keyhole and holed polygon differ
+    points = points[np.abs(points[:, 0] - 3.0) > 1e-6]
+    reference = Polygon(outer[:, ::-1], holes=[inner[:, ::-1]])
+
+    polygon_id = spatial.assign_points_to_polygons(
+        points[:, 0], points[:, 1], vertices, vertex_offsets, bboxes
+    )
+
+    np.testing.assert_array_equal(
+        polygon_id, brute_force_assign([reference], points[:, 0], points[:, 1])
+    )
+    assert polygon_id[(np.abs(points - 5.0) < 1.5).all(axis=1)].max() == 0
+
+
+def test_assign_points_on_shared_edges():
+    # a 4 x 4 grid of unit squares sharing edges. Every point inside the grid,
+    # including points on shared edges and corners, lands in exactly one
+    # adjacent square
+    squares = [
+        np.array([[y, x], [y, x + 1], [y + 1, x + 1], [y + 1, x]], dtype=np.float64)
+        for y in range(4)
+        for x in range(4)
+    ]
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays(squares)
+
+    grid = np.arange(1, 4, dtype=np.float64)
+    mid = grid - 0.5
+    ys = np.concatenate(
+        [np.repeat(grid, 3), np.repeat(mid, 3), np.repeat(grid, 3)]
+    )
+    xs = np.concatenate([np.tile(mid, 3), np.tile(grid, 3), np.tile(grid, 3)])
+
+    polygon_id = spatial.assign_points_to_polygons(
+        ys, xs, vertices, vertex_offsets, bboxes
+    )
+
+    assert np.all(polygon_id > 0)
+    square_y = (polygon_id - 1) // 4
+    square_x = (polygon_id - 1) % 4
+    assert np.all((ys >= square_y) & (ys <= square_y + 1))
+    assert np.all((xs >= square_x) & (xs <= square_x + 1))
+
+
+def test_points_in_polygons_single_cell(mock_polygons, mock_points):
+    ys, xs = mock_points[:, 0], mock_points[:, 1]
+    vertices, vertex_offsets, bboxes = spatial.polygons_to_arrays(mock_polygons)
+
+    # one grid cell holding every polygon, so only the kernel's bounding box
+    # and crossing-number tests decide the assignment
+    grid_origin = np.zeros(2, dtype=np.float64)
+    grid_shape = np.ones(2, dtype=np.int64)
+    cell_ptr = np.array([0, len(mock_polygons)], dtype=np.int64)
+    cell_polygons = np.arange(len(mock_polygons), dtype=np.int64)
+
+    polygon_id = spatial.points_in_polygons(
+        ys,
+        xs,
+        grid_origin,
+        200.0,
+        grid_shape,
+        cell_ptr,
+        cell_polygons,
+        np.ascontiguousarray(bboxes),
+        vertices,
+        vertex_offsets,
+        np.zeros(0, dtype=np.float64),
+        np.zeros((0, 2), dtype=np.float64),
+    )
+
+    np.testing.assert_array_equal(
+        polygon_id, brute_force_assign(mock_polygons, ys, xs)
+    )